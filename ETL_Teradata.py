@@ -1,24 +1,42 @@
 # Import dependences
 import pandas as pd
+import numpy as np
 import time
-from datetime import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
 import logging
 import sys
 
 # Import dependences to interact with database
-from sqlalchemy import create_engine
 import sqlalchemy_teradata
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base, DeferredReflection
-from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy import exc
+from connection_pool import create_pooled_engine, pool_stage, log_connection_stats
 
-# Import dependences to send email with MIME
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+# Import dependence to measure stages
+from instrumentation import configure, stage, record_stage, run_summary, configure_logging, run_log_file
+
+# Import dependence to retry failed queries
+from retry_policy import RetryPolicy
+
+# Import dependence to bulk load temp table
+from bulk_writer import write_chunks, teradata_fastload_loader
+
+# Import dependence to save extracts for failed loads
+from extract_checkpoint import ExtractCheckpoint
+
+# Import dependence to serve repeated queries from disk
+from query_cache import QueryCache
+
+# Import dependence to shrink extract chunks after reading
+from frame_compaction import compact
+
+# Import dependence to send notification emails
+from notifier import Notifier
+
+# Import dependence to remember watermarks between runs
+from run_state import read_state, save_state
 
 # Import dependence to read config
 from configparser import ConfigParser
@@ -40,54 +58,59 @@ ldap_account = parser.get('credentials', 'ldap_account')
 ldap_pw = parser.get('credentials', 'ldap_pw')
 email_to_subject = parser.get('emails', 'email_to_subject')
 email_to_error_subject = parser.get('emails', 'email_to_error_subject')
-email_address = parser.get('credentials', 'email_address')
-email_password = parser.get('credentials', 'email_password')
-email_recipient = parser.get('credentials', 'email_recipient')
+chunk_size = parser.getint('settings', 'chunk_size', fallback=50000)
+load_mode = parser.get('settings', 'load_mode', fallback='append')
+state_file = parser.get('files', 'state_file', fallback='etl_state.json')
+business_key = [key.strip() for key in parser.get('incremental', 'business_key', fallback='').split(',') if key.strip()]
+watermark_column = parser.get('incremental', 'watermark_column', fallback='')
+bulk_strategy = parser.get('settings', 'bulk_strategy', fallback='batched')
+bulk_batch_size = parser.getint('settings', 'bulk_batch_size', fallback=10000)
+staging_dir = parser.get('files', 'staging_dir', fallback='') or None
+td_host = parser.get('database', 'td_host', fallback=user_dsn)
+db_url = parser.get('database', 'url', fallback='')
+session_sql = parser.get('database', 'session_sql', fallback='SET SESSION CHARACTERISTICS AS TRANSACTION ISOLATION LEVEL READ UNCOMMITTED;')  # To avoid locking tables when doing select on tables
+partition_column = parser.get('partition', 'column', fallback='')
+partition_type = parser.get('partition', 'type', fallback='date')
+partition_lower = parser.get('partition', 'lower', fallback='')
+partition_upper = parser.get('partition', 'upper', fallback='')
+partition_count = parser.getint('partition', 'partitions', fallback=4)
+partition_workers = parser.getint('partition', 'workers', fallback=partition_count)
+# Unique, non-null column of the query result, a failed extract continues after its last value read
+resume_column = parser.get('settings', 'resume_column', fallback='')
+retry_policy = RetryPolicy.from_config(parser)
+notifier = Notifier.from_config(parser, retry_policy=retry_policy)
+pool_size = parser.getint('pool', 'pool_size', fallback=max(5, partition_workers + 1))
+max_overflow = parser.getint('pool', 'max_overflow', fallback=2)
+pool_timeout = parser.getint('pool', 'pool_timeout', fallback=300)
+pool_recycle = parser.getint('pool', 'pool_recycle', fallback=3600)
+checkpoint_dir = parser.get('checkpoint', 'directory', fallback='')
+checkpoint_retention_days = parser.getfloat('checkpoint', 'retention_days', fallback=7)
+checkpoint_max_age_hours = parser.getfloat('checkpoint', 'max_age_hours', fallback=24)
+checkpoint_finish_on_failure = parser.getboolean('checkpoint', 'finish_on_failure', fallback=True)
+compact_frames = parser.getboolean('settings', 'compact_frames', fallback=True)
+cache_dir = parser.get('cache', 'directory', fallback='')
+query_cache = QueryCache(cache_dir, ttl=parser.getfloat('cache', 'ttl', fallback=3600),
+                         max_bytes=parser.getint('cache', 'max_bytes', fallback=2 ** 30)) if cache_dir else None
 
 
-# Configure logging information
-logging.basicConfig(level=logging.INFO, filename=log_file, filemode='a', 
-                    format='%(asctime)s -%(levelname)s- %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+# Configure logging information, rotate the log file and keep this run's lines for emails
+configure_logging(log_file, max_bytes=parser.getint('files', 'log_max_bytes', fallback=10 * 2 ** 20),
+                  backup_count=parser.getint('files', 'log_backup_count', fallback=5),
+                  when=parser.get('files', 'log_rotate_when', fallback=None))
+
+# Write stage metrics next to the log file
+configure(log_file, job='ETL_Teradata')
 
 
 # Create a function to send email notification with log attached
 def send_email(subject, body, attachment=True, filename=log_file):
-    '''Send email with or without attachment.'''
+    '''Queue email with or without attachment, it is sent in the background.'''
     # Log info
     logging.info('Trying to send email')
     
     try:
-        # Construct email object
-        msg = MIMEMultipart()
-        msg['From'] = email_address
-        msg['To'] = email_address
-        msg['Subject'] = subject
-        
-        # Send plain text (can send html etc)
-        msg.attach(MIMEText(body,'plain'))
-        
-        if attachment:
-            # Send email with attachments (text, image etc)
-            attachment = open(filename, 'rb')
-            part = MIMEBase('application', 'octat-stream')
-            part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', "attachment; filename= " + filename)
-            msg.attach(part)
-        
-        # Convert msg object into string
-        text = msg.as_string()
-        
-        # Send email via SMTP server and logout when done
-        server = smtplib.SMTP('smtp-mail.outlook.com:587')
-        server.starttls()
-        server.ehlo()
-        server.login(email_address, email_password)
-        server.sendmail(email_address, email_recipient, text)
-        server.quit()
-        
-        # Log info
-        logging.info(f'Email notification is sent to {email_recipient}')
+        # Attach this run's log lines as they are now, gzipped and capped in size
+        notifier.send(subject, body, attachment=run_log_file(filename) if attachment else None, full_path=filename)
         
     except Exception as e:
         
@@ -104,19 +127,25 @@ def conn_engine(account, password, ldap_login=False, dsn=user_dsn, driver=td_dri
     
     try:
         
-        # Check login mechanism and use proper connection string to connect
-        if ldap_login == False:
-            engine = create_engine(f'teradata://{account}:{password}@{dsn}:{port}/?driver={driver}')
+        # Check login mechanism and use proper connection string to connect, a configured url takes precedence
+        if db_url:
+            url = db_url
+        elif ldap_login == False:
+            url = f'teradata://{account}:{password}@{dsn}:{port}/?driver={driver}'
         else:
-            engine = create_engine(f'teradata://{account}:{password}@{dsn}:{port}/?authentication=LDAP&driver={driver}')
-        db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
-        db_session.execute('SET SESSION CHARACTERISTICS AS TRANSACTION ISOLATION LEVEL READ UNCOMMITTED;')  # To avoid locking tables when doing select on tables
-        db_session.commit()
-        Base = declarative_base(cls=DeferredReflection)
-        Base.query = db_session.query_property()
+            url = f'teradata://{account}:{password}@{dsn}:{port}/?authentication=LDAP&driver={driver}'
+        
+        # Pool connections so every stage and parallel worker reuses logons instead of logging on again
+        engine = create_pooled_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                                      pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+                                      session_statements=[session_sql] if session_sql else [])
+        
+        # Log on once to check credentials, the connection goes back to the pool for the next stage
+        with pool_stage('connect'):
+            engine.connect().close()
         
         # Log info
-        logging.info('Successfully Created engine')
+        logging.info(f'Successfully Created engine with pool size {pool_size}')
         return engine
     
     except Exception as e:
@@ -131,30 +160,75 @@ def conn_engine(account, password, ldap_login=False, dsn=user_dsn, driver=td_dri
         raise
 
         
-def process_sql(query, engine, max_retry=50):
-    '''Read data from database to dataframe. If failed, read again until max retry reached.'''
-    # Dispose engine to ensure no database connections are carried over
-    engine.dispose()
-    
+def process_sql(query, engine, chunk_size=chunk_size, policy=retry_policy, resume_column=resume_column, stage_name='extract'):
+    '''Read data from database in chunks, yield one dataframe per chunk. If failed, resume after the last chunk read until the retry policy gives up.'''
     # Initialize variables
-    is_read = 0
-    retry = 0
+    tracker = policy.retrying('Executing query')
+    row_count = 0
+    chunk_count = 0
+    last_key = None
+    
+    # Rows handed to the caller can only be skipped on a retry when sorted by a unique, non-null resume column
+    resumable = bool(resume_column)
+    memory = {}
+    
+    # Time spent fetching, the time the caller spends on each chunk is not counted
+    fetch_wall = 0.0
+    fetch_cpu = 0.0
+    mark_wall, mark_cpu = time.perf_counter(), time.process_time()
     
     # Log info
-    logging.info('Trying to read data')
+    logging.info(f'Trying to read data in chunks of {chunk_size} rows')
     
-    # Run query until result is returned to dataframe or max retry is reached
-    while (is_read == 0) and (retry <= max_retry):
+    # Run query until all chunks are read or the retry policy gives up
+    while True:
+        conn = None
         try:
-            retry += 1   
-            # Run select query
-            df = pd.read_sql(query,engine)
-            is_read = 1
+            # Order by the resume column so a rerun can continue after the last row read
+            if resume_column:
+                resume_filter = f'WHERE {resume_column} > {sql_literal(last_key)}' if last_key is not None else ''
+                sql = f'''SELECT * FROM (
+{query.strip().rstrip(';')}
+) AS src {resume_filter} ORDER BY {resume_column}'''
+            else:
+                # Without a resume column a retry is only made before any row was handed to the caller
+                sql = query
             
-            # Log info
-            logging.info('Successfully read data')
+            # Stream results so rows are fetched from the cursor one chunk at a time
+            with pool_stage('extract'):
+                conn = engine.connect().execution_options(stream_results=True)
+            for chunk in pd.read_sql(sql, conn, chunksize=chunk_size):
+                
+                # Repeated or missing keys would be skipped by "> last key" on a retry, so stop resuming
+                if resumable:
+                    keys = chunk[resume_column]
+                    if keys.isna().any() or keys.duplicated().any() or (last_key is not None and keys.iloc[0] == last_key):
+                        logging.warning(f'{resume_column} is not unique or has NULLs, the extract cannot resume after a failure')
+                        resumable = False
+                
+                # Shrink the chunk before it is queued, cached or written
+                if compact_frames:
+                    chunk = compact(chunk, f'chunk {chunk_count + 1}', stats=memory, level=logging.DEBUG)
+                
+                # Hand each chunk to the caller, so only one chunk is held in memory at a time
+                row_count += len(chunk)
+                chunk_count += 1
+                if resume_column:
+                    last_key = chunk[resume_column].iloc[-1]
+                fetch_wall += time.perf_counter() - mark_wall
+                fetch_cpu += time.process_time() - mark_cpu
+                yield chunk
+                mark_wall, mark_cpu = time.perf_counter(), time.process_time()
+                
+                # Progress: the time the caller spent on the chunk does not count against max_elapsed
+                tracker.succeeded()
             
-            return df
+            # Log info
+            logging.info(f'Successfully read {row_count} rows in {chunk_count} chunks')
+            if memory:
+                logging.info(f"Compacted chunks from {memory['before'] / 2 ** 20:.1f} MB to {memory['after'] / 2 ** 20:.1f} MB")
+            record_stage(stage_name, fetch_wall + time.perf_counter() - mark_wall, fetch_cpu + time.process_time() - mark_cpu, rows=row_count)
+            return
         
         except Exception as e:
             
@@ -168,39 +242,228 @@ def process_sql(query, engine, max_retry=50):
                 err = exc_obj
             
             # Log error
-            logging.error(f'''Error occurred when executing query 
-                             Max attempt: {max_retry + 1} ; Current attempt #{retry} 
+            logging.error(f'''Error occurred when executing query after {row_count} rows 
                             {exc_type}: {err}''')
             
-            # Wait 60s before rerunning the query
-            time.sleep(60)
+            # Release the failed connection before retrying
+            if conn is not None:
+                conn.close()
+                conn = None
             
-            # If max retry is reached, send error email and rethrow exception
-            if retry-1 == max_retry:
-                send_email(email_to_error_subject, f'Unable to query data; Max Attempt #{max_retry + 1} reached')
+            # Rows already handed over would be read again or lost in another order, so do not retry
+            if row_count and not resumable:
+                logging.error(f'Unable to resume after {row_count} rows without a unique resume_column; not retrying')
+                retry = False
+            else:
+                retry = tracker.failed(e)
+            
+            # If the error is fatal or the retry policy gives up, send error email and rethrow exception
+            if not retry:
+                record_stage(stage_name, fetch_wall + time.perf_counter() - mark_wall, fetch_cpu + time.process_time() - mark_cpu, rows=row_count, status='error')
+                send_email(email_to_error_subject, f'Unable to query data; Failed after {tracker.attempt} attempts and {row_count} rows')
                 raise
+        
+        finally:
+            
+            # Release the streaming connection
+            if conn is not None:
+                conn.close()
                 
 
-# Create a function to append new rows to prod table
-def append_new_rows_to_prod(df, temp, prod, engine):
-    '''Delete then add data to temp table, insert only new data to prod table, return rows inserted.'''
-    # Dispose engine to ensure no database connections are carried over
-    engine.dispose()
+# Create a function to read query results through the local result cache
+def cached_sql(query, engine, **kwargs):
+    '''Stream query results as dataframe chunks, from the result cache while a fresh copy is there, else with process_sql.'''
+    if query_cache is None:
+        return process_sql(query, engine, **kwargs)
+    
+    # Same query against another server or account is another entry
+    dsn = db_url or f'{service_account}@{user_dsn}:{port}'
+    return query_cache.chunks(query, dsn, lambda: process_sql(query, engine, **kwargs))
+
+
+# Create a function to split a query into predicate-bounded sub-queries
+def partition_queries(query, column, lower, upper, partitions, kind='date'):
+    '''Split query into one sub-query per partition of column, return list of sub-queries in partition order.'''
+    query = query.strip().rstrip(';')
+    
+    # Hash buckets cover every row, no range is needed
+    if kind == 'hash':
+        return [f'''SELECT * FROM (
+{query}
+) AS src WHERE HASHBUCKET(HASHROW({column})) MOD {partitions} = {i}''' for i in range(partitions)]
+    
+    # Get equal-width boundaries between lower and upper
+    if kind == 'date':
+        lower, upper = date.fromisoformat(lower), date.fromisoformat(upper)
+        step = (upper - lower) / partitions
+        bounds = [f"'{(lower + step * i).isoformat()}'" for i in range(1, partitions)]
+    else:
+        lower, upper = float(lower), float(upper)
+        step = (upper - lower) / partitions
+        bounds = [str(int(lower + step * i)) if kind == 'int' else str(lower + step * i) for i in range(1, partitions)]
+    
+    # First partition also takes rows below lower and NULLs, last takes rows above upper, so no row is lost
+    predicates = []
+    for i in range(partitions):
+        if i == 0:
+            predicates.append(f'({column} < {bounds[0]} OR {column} IS NULL)' if bounds else '1 = 1')
+        elif i == partitions - 1:
+            predicates.append(f'{column} >= {bounds[-1]}')
+        else:
+            predicates.append(f'{column} >= {bounds[i - 1]} AND {column} < {bounds[i]}')
     
+    return [f'''SELECT * FROM (
+{query}
+) AS src WHERE {predicate}''' for predicate in predicates]
+
+
+# Create a function to read sub-queries concurrently and stream their chunks back in order
+def process_sql_parallel(queries, engine, workers=partition_workers, chunk_size=chunk_size, queue_size=2):
+    '''Run sub-queries on a thread pool sharing engine, yield dataframe chunks in sub-query order.'''
     # Log info
-    logging.info('Trying to append new rows to PROD')
+    logging.info(f'Trying to read data in {len(queries)} partitions with {workers} workers')
+    
+    # Bounded queue per partition keeps at most queue_size chunks waiting in memory for each partition
+    queues = [queue.Queue(maxsize=queue_size) for _ in queries]
+    stop = threading.Event()
+    done = object()
+    
+    def put(q, item):
+        # Give up when the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
     
+    def produce(i, sub_query, q):
+        chunks = cached_sql(sub_query, engine, chunk_size=chunk_size, stage_name=f'extract_p{i + 1}')
+        try:
+            for chunk in chunks:
+                if not put(q, chunk):
+                    return
+            put(q, done)
+        except Exception as e:
+            put(q, e)
+        finally:
+            chunks.close()
+    
+    # Partitions are submitted in order, so the partition being consumed is always running or finished
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract')
     try:
+        for i, (sub_query, q) in enumerate(zip(queries, queues)):
+            executor.submit(produce, i, sub_query, q)
+        
+        for i, q in enumerate(queues):
+            while True:
+                item = q.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    logging.error(f'Error occurred when reading partition #{i + 1}')
+                    raise item
+                yield item
         
-        # Delete from temp table
-        engine.execute(f'''DELETE FROM {temp}''')
+        # Log info
+        logging.info(f'Successfully read {len(queries)} partitions')
+    
+    finally:
         
-        # Get database name and table name
-        db = temp.split('.')[0]
-        temp_table= temp.split('.')[1]
+        # Stop remaining workers and wait for them to release their connections
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Create a function to stream query results with or without partitions
+def read_chunks(query, engine):
+    '''Stream query results as dataframe chunks, in parallel partitions if a partition column is configured.'''
+    if partition_column:
+        queries = partition_queries(query, partition_column, partition_lower, partition_upper, partition_count, partition_type)
+        return process_sql_parallel(queries, engine)
+    
+    return cached_sql(query, engine)
+
+
+# Create a function to stream query results through an extract checkpoint
+def extract(query, engine, run_date=None):
+    '''Stream query results as dataframe chunks, from the saved extract when the last load of the query failed. Return chunks and checkpoint.'''
+    if not checkpoint_dir:
+        return read_chunks(query, engine), None
+    
+    checkpoint = ExtractCheckpoint(checkpoint_dir, query, dsn=db_url or user_dsn, run_date=run_date,
+                                   max_age_hours=checkpoint_max_age_hours, finish_on_failure=checkpoint_finish_on_failure)
+    
+    # Resume at the load stage instead of running the query again
+    path = checkpoint.find()
+    if path:
+        return checkpoint.read(path), checkpoint
+    
+    # Save each chunk while it streams to the load
+    return checkpoint.write(read_chunks(query, engine)), checkpoint
+
+
+# Create a function to read the high watermark saved by the last incremental run
+def read_watermark(table, filename=state_file):
+    '''Return the saved high watermark of a table, None if no watermark is saved.'''
+    return read_state(filename).get(table, {}).get('watermark')
+
+
+# Create a function to save the high watermark for the next incremental run
+def save_watermark(table, watermark, filename=state_file):
+    '''Save the high watermark of a table to the state file.'''
+    # Keep watermarks of other tables in the same state file
+    save_state({table: {'watermark': watermark, 'updated_at': datetime.now().isoformat(timespec='seconds')}}, filename)
+    
+    # Log info
+    logging.info(f'Saved watermark {watermark} for {table}')
+
+
+# Create a function to write a value as SQL literal
+def sql_literal(value):
+    '''Return value quoted as SQL string literal unless it is a number.'''
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# Create a function to restrict a query to rows past the watermark
+def apply_watermark(query, column, watermark):
+    '''Wrap the query so only rows with column greater than watermark are returned.'''
+    return f'''SELECT * FROM (
+{query.strip().rstrip(';')}
+) AS src WHERE {column} > {sql_literal(watermark)}'''
+
+
+# Create a function to open a teradatasql connection for FastLoad
+def fastload_connect(account=service_account, password=service_pw, host=td_host):
+    '''Connect to Teradata with the teradatasql driver, return connection.'''
+    import teradatasql
+    return teradatasql.connect(host=host, user=account, password=password)
+
+
+# Create a function to fill the temp table with dataframe chunks
+def load_temp_table(chunks, temp, engine, strategy=bulk_strategy, batch_size=bulk_batch_size):
+    '''Delete from temp table then bulk write each dataframe chunk to it, return rows and columns written.'''
+    # Delete from temp table
+    engine.execute(f'''DELETE FROM {temp}''')
+    
+    # Write dataframe chunks with the configured writer, it falls back to to_sql on failure
+    return write_chunks(chunks, temp, engine, strategy=strategy, batch_size=batch_size,
+                        loader=teradata_fastload_loader(fastload_connect), staging_dir=staging_dir)
+
+
+# Create a function to append new rows to prod table
+def append_new_rows_to_prod(chunks, temp, prod, engine):
+    '''Delete then add data chunks to temp table, insert only new data to prod table, return rows inserted.'''
+    # Log info
+    logging.info('Trying to append new rows to PROD')
+    
+    try:
         
-        # Write dataframe to temp table
-        df.to_sql(name=temp_table, con=engine, schema=db, if_exists='append', index=False)
+        # Delete from temp table and write dataframe chunks to it
+        load_temp_table(chunks, temp, engine)
 
         # Insert only new records to prod table
         r = engine.execute(f'''INSERT INTO {prod}
@@ -235,29 +498,170 @@ def append_new_rows_to_prod(df, temp, prod, engine):
         # Rethrow exception
         raise
 
+
+# Create a function to find the rows of temp table to merge, one per business key
+def dedup_source(conn, temp, columns, keys, watermark_col):
+    '''Return temp, or a derived table of its latest row per business key when a key is in temp more than once.'''
+    key_list = ', '.join(keys)
+    duplicates = conn.execute(f'''SELECT COUNT(*) FROM (SELECT {key_list} FROM {temp}
+                                   GROUP BY {key_list} HAVING COUNT(*) > 1) AS dup''').scalar()
+    if not duplicates:
+        return temp
+    
+    # Without a watermark column there is no way to tell which row is the latest
+    if not watermark_col:
+        raise ValueError(f'{duplicates} business keys ({key_list}) are in the new rows more than once, set watermark_column to keep the latest row per key')
+    
+    # Log warning
+    logging.warning(f'{duplicates} business keys are in the new rows more than once, merging the row with the latest {watermark_col} of each')
+    
+    column_list = ', '.join(columns)
+    return f'''(SELECT {column_list} FROM (SELECT {column_list}, ROW_NUMBER() OVER (PARTITION BY {key_list} ORDER BY {watermark_col} DESC) AS row_num
+                                           FROM {temp}) AS ranked WHERE row_num = 1)'''
+
+
+# Create a function to merge new and changed rows to prod table by business key
+def merge_new_rows_to_prod(chunks, temp, prod, engine, keys=business_key, watermark_col=watermark_column):
+    '''Add data chunks to temp table, merge them to prod table by business key, save watermark, return rows inserted and updated.'''
+    # Log info
+    logging.info('Trying to merge new rows to PROD')
+    
+    try:
+        
+        # Delete from temp table and write dataframe chunks to it
+        row_count, columns = load_temp_table(chunks, temp, engine)
+        
+        # Nothing past the watermark, keep prod table and watermark as is
+        if row_count == 0:
+            logging.info('No new rows to merge to prod')
+            return 0, 0
+        
+        # Merge all rows in one transaction so counts and watermark match what is committed
+        with engine.begin() as conn:
+            
+            if keys:
+                # A row changed again within the watermark window is in temp twice, MERGE allows one source row per target row
+                source = dedup_source(conn, temp, columns, keys, watermark_col)
+                
+                # Count rows whose business key is not in prod yet
+                on_clause = ' AND '.join(f'tgt.{key} = src.{key}' for key in keys)
+                inserted = conn.execute(f'''SELECT COUNT(*) FROM {source} AS src
+                                             WHERE NOT EXISTS (SELECT 1 FROM {prod} AS tgt WHERE {on_clause})''').scalar()
+                
+                # Update matched rows and insert the rest in a single keyed MERGE
+                update_cols = [col for col in columns if col not in keys]
+                matched = f'''WHEN MATCHED THEN UPDATE SET {', '.join(f'{col} = src.{col}' for col in update_cols)}''' if update_cols else ''
+                r = conn.execute(f'''MERGE INTO {prod} AS tgt
+                                      USING {source} AS src
+                                      ON {on_clause}
+                                      {matched}
+                                      WHEN NOT MATCHED THEN INSERT ({', '.join(columns)})
+                                      VALUES ({', '.join(f'src.{col}' for col in columns)})''')
+                updated = r.rowcount - inserted if update_cols else 0
+            
+            else:
+                # Without a business key every row past the watermark is new
+                r = conn.execute(f'''INSERT INTO {prod} ({', '.join(columns)})
+                                      SELECT {', '.join(columns)} FROM {temp}''')
+                inserted = r.rowcount
+                updated = 0
+            
+            # Get the new high watermark from the rows just merged
+            if watermark_col:
+                watermark = conn.execute(f'''SELECT MAX({watermark_col}) FROM {temp}''').scalar()
+        
+        # Save watermark only after the merge is committed
+        if watermark_col and watermark is not None:
+            if not isinstance(watermark, (int, float)):
+                watermark = str(watermark)
+            save_watermark(prod, watermark)
+        
+        # Log info
+        logging.info(f'Successfully merged new rows to prod; {inserted} inserted, {updated} updated')
+        
+        # Return number of rows inserted and updated in prod
+        return inserted, updated
+    
+    except Exception as e:
+        
+        # Get exception information
+        exc_type, exc_obj, exc_tb = sys.exc_info()
+        
+        # Remove SQL statement returned in DatabaseError
+        if exc_type == exc.DatabaseError:
+            err = str(exc_obj).split(')')[2]
+        else:
+            err = exc_obj
+            
+        # Log error
+        logging.error(f'''Error occurred when merging new rows to prod 
+                         {exc_type}: {err}''')
+        
+        # Send email
+        send_email(email_to_error_subject, 'Unable to merge new rows to prod')
+        
+        # Rethrow exception
+        raise
+
         
 def main():
     '''Run functions'''
+    chunks = None
     try:
         
+        # Remove extract checkpoints past their retention
+        if checkpoint_dir:
+            ExtractCheckpoint.cleanup(checkpoint_dir, checkpoint_retention_days)
+        
         # create engine and connection
-        engine = conn_engine(service_account, service_pw)
+        with stage('connect'):
+            engine = conn_engine(service_account, service_pw)
         
         # Read sql query in text file
         with open(query_file,'r') as q:
             query = q.read()
         
-        # Read data from database to dataframe
-        df = process_sql(query, engine)
-        
-        # Insert only new records and get number of rows inserted
-        insert_row_count = append_new_rows_to_prod(df, temp_db, prod_db, engine)
-        
         # Get today's date
         today = datetime.today().strftime('%Y-%m-%d')
         
-        # Send email
-        send_email(email_to_subject, f'{insert_row_count} rows are inserted to {prod_db} on {today}')
+        if load_mode == 'incremental':
+            
+            # Only extract rows past the watermark saved by the last run
+            watermark = read_watermark(prod_db)
+            if watermark_column and watermark is not None:
+                query = apply_watermark(query, watermark_column, watermark)
+            
+            # Stream data from database or the checkpoint of a failed load as dataframe chunks
+            chunks, checkpoint = extract(query, engine, today)
+            
+            # Merge new and changed records and get number of rows inserted and updated
+            with pool_stage('load'), stage('load') as s:
+                insert_row_count, update_row_count = merge_new_rows_to_prod(chunks, temp_db, prod_db, engine)
+                s.add(rows=insert_row_count + update_row_count)
+            
+            # The next run of the same query extracts again
+            if checkpoint is not None:
+                checkpoint.mark_loaded()
+            
+            # Send email with run summary
+            send_email(email_to_subject, f'{insert_row_count} rows are inserted and {update_row_count} rows are updated in {prod_db} on {today}\n\n{run_summary()}')
+        
+        else:
+            
+            # Stream data from database or the checkpoint of a failed load as dataframe chunks
+            chunks, checkpoint = extract(query, engine, today)
+            
+            # Insert only new records and get number of rows inserted
+            with pool_stage('load'), stage('load') as s:
+                insert_row_count = append_new_rows_to_prod(chunks, temp_db, prod_db, engine)
+                s.add(rows=insert_row_count)
+            
+            # The next run of the same query extracts again
+            if checkpoint is not None:
+                checkpoint.mark_loaded()
+            
+            # Send email with run summary
+            send_email(email_to_subject, f'{insert_row_count} rows are inserted to {prod_db} on {today}\n\n{run_summary()}')
     
     except Exception as e:
         
@@ -269,8 +673,22 @@ def main():
     
     finally:
         
+        # Finish a checkpoint the failed load left open while the engine is still there
+        if chunks is not None:
+            chunks.close()
+        
+        # Log result cache hits and misses of this run
+        if query_cache is not None:
+            query_cache.log_stats()
+        
+        # Log connection acquisition latency per stage
+        log_connection_stats()
+        
         # Dispose engine and close connections
         engine.dispose()
+        
+        # Send queued emails and log out of the mail server
+        notifier.close()
     
     
 
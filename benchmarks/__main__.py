@@ -0,0 +1,68 @@
+'''Run every pipeline end to end at growing scales and report throughput and memory.
+
+Run from the repository root:
+    python -m benchmarks --scales 1000 10000 100000 --output bench_results.json
+'''
+# Import dependences
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.pipelines import PIPELINES, REPO_ROOT
+
+
+def measure(pipeline, rows, keep=False):
+    '''Prepare inputs of rows for pipeline, run it in a fresh process, return the result.'''
+    prepare = PIPELINES[pipeline][0]
+    workdir = tempfile.mkdtemp(prefix=f'bench_{pipeline}_')
+    try:
+        rows = prepare(workdir, rows)
+
+        # A fresh process per run so peak memory belongs to this pipeline and scale only
+        completed = subprocess.run([sys.executable, '-m', 'benchmarks.pipelines', pipeline, workdir],
+                                   cwd=REPO_ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {'pipeline': pipeline, 'rows': rows, 'ok': False, 'error': completed.stderr.strip().splitlines()[-1:]}
+
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        result['rows'] = rows
+        result['rows_per_s'] = round(rows / result['seconds'], 1) if result['seconds'] else None
+        return result
+
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    '''Measure every pipeline at every scale and print a table'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--pipelines', nargs='+', default=list(PIPELINES), choices=list(PIPELINES))
+    arg_parser.add_argument('--scales', nargs='+', type=int, default=[1000, 10000, 100000])
+    arg_parser.add_argument('--output', help='write results as JSON to this file')
+    arg_parser.add_argument('--keep', action='store_true', help='keep working directories for inspection')
+    args = arg_parser.parse_args()
+
+    results = []
+    print(f'{"pipeline":<8} {"rows":>10} {"seconds":>9} {"rows/s":>11} {"peak MB":>9} {"+MB":>8} {"ok":>4}')
+    for pipeline in args.pipelines:
+        for rows in args.scales:
+            r = measure(pipeline, rows, keep=args.keep)
+            results.append(r)
+            if 'seconds' not in r:
+                print(f'{pipeline:<8} {r["rows"]:>10} failed: {r.get("error")}')
+                continue
+            growth = r['peak_mb'] - r['baseline_mb'] if r['peak_mb'] and r['baseline_mb'] else None
+            print(f'{pipeline:<8} {r["rows"]:>10} {r["seconds"]:>9.2f} {r["rows_per_s"] or 0:>11,.0f} '
+                  f'{r["peak_mb"] or 0:>9.1f} {growth or 0:>8.1f} {str(r["ok"]):>4}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
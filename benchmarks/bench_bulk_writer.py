@@ -0,0 +1,83 @@
+'''Compare rows/sec of the bulk writer strategies against a SQLite stand-in for the Teradata temp table.
+
+Run from the repository root:
+    python -m benchmarks.bench_bulk_writer --rows 100000 --chunk-size 50000 --batch-size 10000
+'''
+# Import dependences
+import os
+import csv
+import time
+import sqlite3
+import argparse
+import tempfile
+
+# Import dependences to manipulate data
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+# Import dependence to benchmark
+from bulk_writer import WRITERS, write_chunks
+
+
+# Create synthetic extract chunks shaped like a daily Teradata extract
+def synthetic_chunks(rows, chunk_size, seed=0):
+    '''Yield dataframe chunks with id, date, category, amount and text columns.'''
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - start)
+        yield pd.DataFrame({
+            'id': np.arange(start, start + n),
+            'event_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D'),
+            'category': rng.choice(['A', 'B', 'C', 'D'], n),
+            'amount': rng.normal(100, 25, n).round(2),
+            'note': [f'row {i}' for i in range(start, start + n)],
+        })
+
+
+# Create a FastLoad stand-in that bulk loads the staged CSV into SQLite in one transaction
+def sqlite_loader(db_path):
+    '''Return loader function that loads a staged CSV file into a SQLite table.'''
+    def load(path, table, columns):
+        with open(path, newline='') as f, sqlite3.connect(db_path) as con:
+            reader = csv.reader(f)
+            next(reader)
+            con.executemany(f'''INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})''', reader)
+    return load
+
+
+# Create a function to time one strategy
+def run_strategy(strategy, rows, chunk_size, batch_size):
+    '''Write rows to a fresh SQLite table with strategy, return rows written and rows/sec.'''
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.sqlite')
+        engine = create_engine(f'sqlite:///{db_path}')
+        with engine.begin() as conn:
+            conn.exec_driver_sql('CREATE TABLE temp_table (id INTEGER, event_date TIMESTAMP, category TEXT, amount REAL, note TEXT)')
+
+        start = time.perf_counter()
+        row_count, _ = write_chunks(synthetic_chunks(rows, chunk_size), 'temp_table', engine, strategy=strategy,
+                                    batch_size=batch_size, loader=sqlite_loader(db_path), staging_dir=tmp)
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+    return row_count, row_count / elapsed
+
+
+def main():
+    '''Run benchmark for every strategy and print rows/sec'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--chunk-size', type=int, default=50000)
+    arg_parser.add_argument('--batch-size', type=int, default=10000)
+    arg_parser.add_argument('--strategies', nargs='+', default=list(WRITERS))
+    args = arg_parser.parse_args()
+
+    print(f'{"strategy":<10} {"rows":>10} {"rows/sec":>12}')
+    for strategy in args.strategies:
+        row_count, rate = run_strategy(strategy, args.rows, args.chunk_size, args.batch_size)
+        print(f'{strategy:<10} {row_count:>10} {rate:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
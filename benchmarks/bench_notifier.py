@@ -0,0 +1,75 @@
+'''Send bursts of notification emails through Notifier to a local SMTP server that drops idle connections.
+
+Needs aiosmtpd. Run from the repository root:
+    python -m benchmarks.bench_notifier --bursts 5 --emails 50 --batch-size 20 --server-timeout 0.5
+'''
+# Import dependences
+import os
+import time
+import argparse
+import tempfile
+
+# Import dependences to send and receive email
+from benchmarks.mocks import smtp_server
+from notifier import Notifier, SMTPSession
+
+
+# Create a function to write a log file to attach
+def write_log(path, lines):
+    '''Write lines of log text to path.'''
+    with open(path, 'w') as f:
+        for i in range(lines):
+            f.write(f'2024-01-01 00:00:00 INFO Processed batch {i} of {lines}\n')
+
+
+# Create a function to time sending bursts of emails over one session
+def run_bursts(bursts, emails, batch_size, server_timeout, attachment_lines):
+    '''Send bursts of emails with a pause longer than server_timeout between them, return counts and emails/sec.'''
+    with tempfile.TemporaryDirectory() as tmp, smtp_server(timeout=server_timeout) as (host, port, messages):
+        attachment = os.path.join(tmp, 'run.log')
+        write_log(attachment, attachment_lines)
+
+        # The notifier keeps its session longer than the server does, so every burst after the first must reconnect
+        session = SMTPSession(host=host, port=port, starttls=False)
+        notifier = Notifier('sender@example.com', 'recipient@example.com', session, batch_size=batch_size,
+                            idle_timeout=server_timeout * 10)
+
+        sending = 0
+        for burst in range(bursts):
+            if burst:
+                time.sleep(server_timeout * 2)
+            start = time.perf_counter()
+            for i in range(emails):
+                notifier.send(f'Burst {burst} email {i}', 'Run finished', attachment=attachment if i % 10 == 0 else None)
+            notifier.flush()
+            sending += time.perf_counter() - start
+        notifier.close()
+
+        # The server handles DATA on its own thread, give it a moment to store the last message
+        deadline = time.monotonic() + 5
+        while len(messages) < notifier.sent and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        return {'sent': notifier.sent, 'failed': notifier.failed, 'received': len(messages), 'logins': session.logins,
+                'emails_per_s': notifier.sent / sending if sending else 0}
+
+
+def main():
+    '''Run benchmark and print emails/sec, logins and whether every email arrived over one login per burst'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--bursts', type=int, default=5)
+    arg_parser.add_argument('--emails', type=int, default=50)
+    arg_parser.add_argument('--batch-size', type=int, default=20)
+    arg_parser.add_argument('--server-timeout', type=float, default=0.5)
+    arg_parser.add_argument('--attachment-lines', type=int, default=10000)
+    args = arg_parser.parse_args()
+
+    r = run_bursts(args.bursts, args.emails, args.batch_size, args.server_timeout, args.attachment_lines)
+    ok = r['received'] == r['sent'] == args.bursts * args.emails and not r['failed'] and r['logins'] == args.bursts
+
+    print(f'{"emails":>8} {"received":>9} {"failed":>7} {"logins":>7} {"emails/sec":>11} {"ok":>4}')
+    print(f'{r["sent"]:>8} {r["received"]:>9} {r["failed"]:>7} {r["logins"]:>7} {r["emails_per_s"]:>11,.0f} {str(ok):>4}')
+
+
+if __name__ == '__main__':
+    main()
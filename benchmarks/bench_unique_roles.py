@@ -0,0 +1,88 @@
+'''Compare the per-area loop with the vectorized unique roles per Functional Area on a merged roles frame.
+
+Run from the repository root:
+    python -m benchmarks.bench_unique_roles --rows 1000000 --areas 8 --app-ids 20000
+'''
+# Import dependences
+import os
+import time
+import argparse
+
+# Import dependences to manipulate data
+import numpy as np
+import pandas as pd
+
+# Import dependence to benchmark, keep its stage metrics out of the working directory
+from instrumentation import configure
+from role_id_combine_excels import build_unique_roles
+from benchmarks.synthetic import FUNCTIONAL_AREAS, ROLE_PREFIXES
+configure(metrics_file=os.devnull)
+
+
+# Create a merged roles frame shaped like the one role_id_combine_excels builds
+def synthetic_roles(rows, areas, app_ids, roles=5000, unmatched=0.2, seed=0):
+    '''Return frame with Functional Area and the comma separated Role Name of one of app_ids per row.'''
+    rng = np.random.default_rng(seed)
+    names = np.array([f'{ROLE_PREFIXES[k % len(ROLE_PREFIXES)]}_{k:05d}' for k in range(roles)], dtype=object)
+
+    # Each App ID maps to one to three roles joined like read_mapping does, some IDs have no mapping
+    mapping = [', '.join(rng.choice(names, rng.integers(1, 4), replace=False)) for _ in range(app_ids)]
+    mapping = np.array(mapping, dtype=object)
+    mapping[rng.random(app_ids) < unmatched] = np.nan
+
+    area_names = [FUNCTIONAL_AREAS[i] if i < len(FUNCTIONAL_AREAS) else f'Area {i}' for i in range(areas)]
+    return pd.DataFrame({'Functional Area': rng.choice(area_names, rows),
+                         'Role Name': mapping[rng.integers(0, app_ids, rows)]})
+
+
+# The implementation build_unique_roles replaced
+def loop_unique_roles(df_roles):
+    '''Return one column per Functional Area listing its unique role names, one boolean scan per area.'''
+    ls_all_unique_roles = []
+    for function in df_roles['Functional Area'].unique().tolist():
+        role_list = df_roles.loc[df_roles['Functional Area'] == function, 'Role Name'].tolist()
+        roles = []
+        for r in role_list:
+            if type(r) != float:
+                roles.extend(r.split(','))
+        ls_all_unique_roles.append(pd.Series(list(set(roles)), name=function, dtype=object))
+    return pd.concat(ls_all_unique_roles, axis=1)
+
+
+# Create a function to time one implementation
+def run(build, df_roles, repeat):
+    '''Return best seconds of repeat runs and the result of build.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = build(df_roles)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    '''Time both implementations, check they list the same roles per area and print the speedup'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=1000000)
+    arg_parser.add_argument('--areas', type=int, default=8)
+    arg_parser.add_argument('--app-ids', type=int, default=20000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    df_roles = synthetic_roles(args.rows, args.areas, args.app_ids)
+    loop_seconds, expected = run(loop_unique_roles, df_roles, args.repeat)
+    vectorized_seconds, result = run(build_unique_roles, df_roles, args.repeat)
+
+    # Same areas in the same order, same set of roles in every area
+    same = list(expected.columns) == list(result.columns) and all(
+        set(expected[c].dropna()) == set(result[c].dropna()) for c in expected.columns)
+
+    print(f'{"implementation":<12} {"rows":>10} {"seconds":>10} {"rows/sec":>14}')
+    for name, seconds in (('loop', loop_seconds), ('vectorized', vectorized_seconds)):
+        print(f'{name:<12} {args.rows:>10} {seconds:>10.3f} {args.rows / seconds:>14,.0f}')
+    print(f'speedup {loop_seconds / vectorized_seconds:.1f}x, same result: {same}')
+
+
+if __name__ == '__main__':
+    main()
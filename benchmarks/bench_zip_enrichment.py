@@ -0,0 +1,73 @@
+'''Compare one query per ZIP code, as in geo_demographic.ipynb, with the batch join of ZipEnricher on an extract.
+
+Run from the repository root:
+    python -m benchmarks.bench_zip_enrichment --rows 200000 --zipcodes 42000
+'''
+# Import dependences
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+
+# Import dependences to manipulate data
+import numpy as np
+import pandas as pd
+
+# Import dependence to benchmark
+from zip_enrichment import ZipEnricher, HEAVY_COLUMNS
+from benchmarks.synthetic import zipcode_database
+
+
+# The notebook pattern: look up every ZIP code on its own and drop polygon from the result
+def lookup_per_row(db_file, zips):
+    '''Return dataframe with the details of each ZIP code in zips, one query per ZIP code.'''
+    with sqlite3.connect(db_file) as con:
+        con.row_factory = sqlite3.Row
+        records = []
+        for zipcode in zips:
+            row = con.execute('SELECT * FROM simple_zipcode WHERE zipcode = ?', (zipcode,)).fetchone()
+            records.append({key: row[key] for key in row.keys() if key not in HEAVY_COLUMNS} if row else {})
+    return pd.DataFrame.from_records(records)
+
+
+def main():
+    '''Time both ways of enriching an extract, check they give the same details and print the speedup'''
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=200000)
+    arg_parser.add_argument('--zipcodes', type=int, default=42000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'simple_db.sqlite')
+        codes = zipcode_database(db_file, args.zipcodes)
+
+        # Extract ZIP codes as they arrive: numbers without leading zeros, ZIP+4 and a few unknown ones
+        rng = np.random.default_rng(1)
+        zips = rng.choice(codes + ['00000'], args.rows).astype(object)
+        zips[::7] = [int(z) for z in zips[::7]]
+        zips[::11] = [f'{z}-1234' for z in zips[::11]]
+        extract = pd.DataFrame({'id': np.arange(args.rows), 'zip': zips})
+
+        start = time.perf_counter()
+        expected = lookup_per_row(db_file, [str(z).split('-')[0].zfill(5) for z in zips])
+        per_row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        enricher = ZipEnricher(db_file)
+        load_seconds = time.perf_counter() - start
+        result = enricher.enrich(extract)
+        batch_seconds = time.perf_counter() - start
+
+    # Same details for every row, unknown ZIP codes empty in both
+    columns = [c for c in expected.columns if c != 'zipcode']
+    same = expected[columns].reset_index(drop=True).equals(result[columns].reset_index(drop=True))
+
+    print(f'{"implementation":<14} {"rows":>10} {"seconds":>10} {"rows/sec":>14}')
+    for name, seconds in (('per row', per_row_seconds), ('batch', batch_seconds)):
+        print(f'{name:<14} {args.rows:>10} {seconds:>10.3f} {args.rows / seconds:>14,.0f}')
+    print(f'batch includes {load_seconds:.3f}s to load the table, speedup {per_row_seconds / batch_seconds:.1f}x, same result: {same}')
+
+
+if __name__ == '__main__':
+    main()
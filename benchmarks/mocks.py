@@ -0,0 +1,203 @@
+'''Local stand-ins for SMTP, Exchange and HTTP so pipelines run end to end without network access.'''
+# Import dependences
+import io
+import sys
+import types
+import socket
+import itertools
+import smtplib
+import threading
+import functools
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+
+class FakeSMTP:
+    '''Accept every SMTP call and keep the sent messages.'''
+    sent = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def starttls(self, *args, **kwargs):
+        return 220, b'ready'
+
+    def ehlo(self, *args, **kwargs):
+        return 250, b'ok'
+
+    def login(self, *args, **kwargs):
+        return 235, b'ok'
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        FakeSMTP.sent.append((from_addr, to_addrs, len(msg)))
+        return {}
+
+    def send_message(self, msg, from_addr=None, to_addrs=None, *args, **kwargs):
+        FakeSMTP.sent.append((from_addr, to_addrs, len(msg.as_bytes())))
+        return {}
+
+    def noop(self):
+        return 250, b'ok'
+
+    def quit(self):
+        return 221, b'bye'
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_smtp():
+    '''Replace smtplib.SMTP with FakeSMTP inside the block.'''
+    original = smtplib.SMTP
+    smtplib.SMTP = FakeSMTP
+    try:
+        yield FakeSMTP.sent
+    finally:
+        smtplib.SMTP = original
+
+
+@contextmanager
+def smtp_server(**server_kwargs):
+    '''Run a local aiosmtpd server inside the block, yield (host, port, received messages), server_kwargs go to its SMTP.'''
+    # Import here so aiosmtpd is only required by callers that want a real SMTP conversation
+    from aiosmtpd.controller import Controller
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return '250 Message accepted for delivery'
+
+    # Controller checks the server by connecting to its port, so it cannot be 0
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    handler = Handler()
+    controller = Controller(handler, hostname='127.0.0.1', port=port, **server_kwargs)
+    controller.start()
+    try:
+        yield controller.hostname, port, handler.messages
+    finally:
+        controller.stop()
+
+
+class FakeAttachment:
+    '''File attachment with a name and content, streamed through fp like exchangelib FileAttachment.'''
+    ids = itertools.count(1)
+
+    def __init__(self, name, content, attachment_id=None):
+        self.name = name
+        self.content = content
+        self.size = len(content)
+        self.attachment_id = types.SimpleNamespace(id=attachment_id or f'attachment-{next(FakeAttachment.ids)}')
+
+    @property
+    def fp(self):
+        return io.BytesIO(self.content)
+
+
+class FakeMessage:
+    '''Email message with subject, received time and attachments.'''
+
+    def __init__(self, subject, attachments, received=None, message_id='1'):
+        self.subject = subject
+        self.attachments = attachments
+        self.datetime_received = received or datetime.now(timezone.utc)
+        self.id = message_id
+        self.message_id = message_id
+
+
+class FakeQuerySet:
+    '''Subset of the exchangelib QuerySet API used by the pipeline.'''
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def filter(self, *args, **kwargs):
+        # Only subject__startswith, datetime_received__gt and datetime_received__gte are supported
+        messages = self.messages
+        if 'subject__startswith' in kwargs:
+            messages = [m for m in messages if m.subject.startswith(kwargs['subject__startswith'])]
+        if 'datetime_received__gt' in kwargs:
+            messages = [m for m in messages if m.datetime_received > kwargs['datetime_received__gt']]
+        if 'datetime_received__gte' in kwargs:
+            messages = [m for m in messages if m.datetime_received >= kwargs['datetime_received__gte']]
+        return FakeQuerySet(messages)
+
+    def order_by(self, field):
+        reverse = field.startswith('-')
+        return FakeQuerySet(sorted(self.messages, key=lambda m: getattr(m, field.lstrip('-')), reverse=reverse))
+
+    def only(self, *fields):
+        return self
+
+    def __getitem__(self, item):
+        return self.messages[item]
+
+    def __iter__(self):
+        return iter(self.messages)
+
+
+def fake_exchangelib(messages):
+    '''Return fake exchangelib modules whose inbox holds messages.'''
+    exchangelib = types.ModuleType('exchangelib')
+    protocol = types.ModuleType('exchangelib.protocol')
+    errors = types.ModuleType('exchangelib.errors')
+
+    class Account:
+        def __init__(self, *args, **kwargs):
+            self.inbox = FakeQuerySet(messages)
+
+    exchangelib.Credentials = lambda *args, **kwargs: None
+    exchangelib.Configuration = lambda *args, **kwargs: None
+    exchangelib.Account = Account
+    exchangelib.DELEGATE = 'delegate'
+    exchangelib.EWSDateTime = type('EWSDateTime', (), {'from_datetime': staticmethod(lambda dt: dt)})
+    protocol.BaseProtocol = type('BaseProtocol', (), {'HTTP_ADAPTER_CLS': None})
+    protocol.NoVerifyHTTPAdapter = object
+    errors.TransportError = type('TransportError', (Exception,), {})
+    errors.ErrorServerBusy = type('ErrorServerBusy', (Exception,), {})
+    exchangelib.protocol = protocol
+    exchangelib.errors = errors
+
+    return {'exchangelib': exchangelib, 'exchangelib.protocol': protocol, 'exchangelib.errors': errors}
+
+
+@contextmanager
+def patched_modules(modules):
+    '''Install modules in sys.modules inside the block, restore the previous ones after.'''
+    previous = {name: sys.modules.get(name) for name in modules}
+    sys.modules.update(modules)
+    try:
+        yield
+    finally:
+        for name, module in previous.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    '''Serve files without logging every request to stderr.'''
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def http_server(directory):
+    '''Serve directory over HTTP on a free local port, yield the base URL.'''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,171 @@
+'''Prepare and run each pipeline end to end in a working directory against local stand-ins.'''
+# Import dependences
+import os
+import sys
+import glob
+import json
+import time
+import runpy
+import types
+import sqlite3
+import argparse
+
+# Scripts import their shared modules from the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import synthetic
+from benchmarks.mocks import fake_smtp, fake_exchangelib, patched_modules, http_server, FakeAttachment, FakeMessage
+
+
+# Settings shared by every benchmark config file
+CREDENTIALS = {'email_address': 'bench@example.com', 'email_password': 'x', 'email_recipient': 'bench@example.com'}
+EMAILS = {'email_to_subject': 'Benchmark done', 'email_to_error_subject': 'Benchmark error'}
+
+
+def write_ini(path, sections):
+    '''Write sections dict to an ini file.'''
+    from configparser import ConfigParser
+    parser = ConfigParser()
+    parser.read_dict(sections)
+    with open(path, 'w') as f:
+        parser.write(f)
+
+
+def script(name):
+    '''Return path of a pipeline script in the repository root.'''
+    return os.path.join(REPO_ROOT, name)
+
+
+# role_id_combine_excels.py: input/*.xlsx and mapping.xlsx in the working directory
+def prepare_role(workdir, rows):
+    return synthetic.role_inputs(workdir, rows)
+
+
+def run_role(workdir):
+    runpy.run_path(script('role_id_combine_excels.py'), run_name='__main__')
+
+
+def check_role(workdir):
+    return bool(glob.glob(os.path.join(workdir, 'output_*.xlsx')))
+
+
+# email_attachment_to_database.py: status report arrives by (fake) Exchange, loads into SQLite instead of MSSQL
+def prepare_email(workdir, rows):
+    synthetic.status_report(os.path.join(workdir, 'attachment.xlsx'), rows)
+    write_ini(os.path.join(workdir, 'HOS.ini'), {
+        'credentials': CREDENTIALS,
+        'emails': {'email_from_subject': 'Status Report', **EMAILS},
+        'files': {'download_file_name': 'report.xlsx', 'download_location': workdir, 'log_file': 'Runtime_info.log'},
+        'settings': {'email_server': 'localhost'},
+        'db': {'db_host': 'localhost', 'db_name': 'bench', 'db_table_name': 'status_report',
+               'db_url': f"sqlite:///{os.path.join(workdir, 'mssql.sqlite')}"},
+    })
+    return rows
+
+
+def run_email(workdir):
+    with open(os.path.join(workdir, 'attachment.xlsx'), 'rb') as f:
+        message = FakeMessage('Status Report daily', [FakeAttachment('status.xlsx', f.read())])
+    with patched_modules(fake_exchangelib([message])), fake_smtp():
+        runpy.run_path(script('email_attachment_to_database.py'), run_name='__main__')
+
+
+def check_email(workdir):
+    with sqlite3.connect(os.path.join(workdir, 'mssql.sqlite')) as con:
+        return con.execute('SELECT COUNT(*) FROM status_report').fetchone()[0] > 0
+
+
+# pull_covid_data.py: CSVs are served by a local HTTP server
+def prepare_covid(workdir, rows):
+    os.makedirs(os.path.join(workdir, 'server'), exist_ok=True)
+    os.makedirs(os.path.join(workdir, 'share'), exist_ok=True)
+    days = max(1, rows // len(synthetic.STATES))
+    synthetic.covid_csvs(os.path.join(workdir, 'server'), days)
+    return days * len(synthetic.STATES)
+
+
+def run_covid(workdir):
+    with http_server(os.path.join(workdir, 'server')) as base_url, fake_smtp():
+        write_ini(os.path.join(workdir, 'pull_covid_csv.ini'), {
+            'files': {'log_file': 'Runtime_info.log', 'save_to_filepath': os.path.join(workdir, 'share')},
+            'emails': EMAILS,
+            'credentials': CREDENTIALS,
+            'urls': {'historical_url': f'{base_url}/daily.csv', 'current_url': f'{base_url}/current.csv'},
+        })
+        runpy.run_path(script('pull_covid_data.py'), run_name='__main__')
+
+
+def check_covid(workdir):
+    return os.path.exists(os.path.join(workdir, 'share', 'daily.csv'))
+
+
+# ETL_Teradata.py: SQLite stand-in for the Teradata source, temp and prod tables
+def prepare_etl(workdir, rows):
+    synthetic.etl_database(os.path.join(workdir, 'teradata.sqlite'), rows)
+    with open(os.path.join(workdir, 'query.txt'), 'w') as f:
+        f.write('SELECT * FROM src_table')
+    write_ini(os.path.join(workdir, 'config.ini'), {
+        'settings': {'chunk_size': '50000'},
+        'files': {'log_file': 'Runtime_info.log', 'query_file': 'query.txt', 'save_to_filepath': workdir},
+        'emails': EMAILS,
+        'database': {'user_dsn': 'bench', 'td_driver': 'none', 'port': '0', 'temp_db': 'main.temp_table',
+                     'prod_db': 'main.prod_table', 'url': f"sqlite:///{os.path.join(workdir, 'teradata.sqlite')}",
+                     'session_sql': ''},
+        'credentials': {**CREDENTIALS, 'service_account': 'bench', 'service_pw': 'x', 'ldap_account': '', 'ldap_pw': ''},
+    })
+    return rows
+
+
+def run_etl(workdir):
+    # The Teradata dialect is only needed for teradata:// URLs
+    modules = {}
+    try:
+        import sqlalchemy_teradata
+    except ImportError:
+        modules['sqlalchemy_teradata'] = types.ModuleType('sqlalchemy_teradata')
+    with patched_modules(modules), fake_smtp():
+        runpy.run_path(script('ETL_Teradata.py'), run_name='__main__')
+
+
+def check_etl(workdir):
+    with sqlite3.connect(os.path.join(workdir, 'teradata.sqlite')) as con:
+        return con.execute('SELECT COUNT(*) FROM prod_table').fetchone()[0] > 0
+
+
+PIPELINES = {
+    'role': (prepare_role, run_role, check_role),
+    'email': (prepare_email, run_email, check_email),
+    'covid': (prepare_covid, run_covid, check_covid),
+    'etl': (prepare_etl, run_etl, check_etl),
+}
+
+
+def run(pipeline, workdir):
+    '''Run pipeline in workdir, return seconds, memory before/after in MB and whether the output is there.'''
+    from instrumentation import memory_mb
+    _, run_pipeline, check = PIPELINES[pipeline]
+
+    os.chdir(workdir)
+    _, baseline = memory_mb()
+    start = time.perf_counter()
+    run_pipeline(workdir)
+    seconds = time.perf_counter() - start
+    rss, peak = memory_mb()
+
+    return {'pipeline': pipeline, 'seconds': round(seconds, 3), 'baseline_mb': baseline and round(baseline, 1),
+            'peak_mb': peak and round(peak, 1), 'ok': check(workdir)}
+
+
+def main():
+    '''Run one pipeline in a prepared working directory and print the result as JSON'''
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('pipeline', choices=list(PIPELINES))
+    arg_parser.add_argument('workdir')
+    args = arg_parser.parse_args()
+    print(json.dumps(run(args.pipeline, os.path.abspath(args.workdir))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+'''Synthetic inputs for every pipeline, shaped like the production files at a configurable scale.'''
+# Import dependences
+import os
+import io
+import sqlite3
+
+# Import dependences to manipulate data
+import numpy as np
+import pandas as pd
+
+
+FUNCTIONAL_AREAS = ['Finance', 'HR', 'Procurement', 'Supply Chain', 'Sales', 'Manufacturing', 'Quality', 'IT']
+ROLE_PREFIXES = ['DISPLAY', 'MAINTAIN', 'APPROVE', 'POST', 'REPORT', 'BATCH', 'CUTOVER', 'CONFIG']
+STATUSES = ['In Progress', 'New', 'Pending Acknowledgement', 'Closed', 'Cancelled', 'Resolved']
+STATES = ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI', 'IA', 'ID', 'IL', 'IN', 'KS', 'KY',
+          'LA', 'MA', 'MD', 'ME', 'MI', 'MN', 'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH',
+          'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VT', 'WA', 'WI', 'WV', 'WY']
+
+
+def role_inputs(directory, rows, files=10, app_ids=2000, seed=0):
+    '''Write files input/*.xlsx workbooks with rows in total and a mapping.xlsx with a Role-ID sheet into directory.'''
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(directory, 'input'), exist_ok=True)
+
+    # Input workbooks: first sheet holds the user/App ID rows, a second sheet is ignored by the pipeline
+    per_file = max(1, rows // files)
+    for i in range(files):
+        areas = rng.choice(FUNCTIONAL_AREAS + [None], per_file)
+        df = pd.DataFrame({
+            'User ID': [f'U{i:03d}{j:06d}' for j in range(per_file)],
+            'Functional Area': areas,
+            'App ID': rng.integers(0, app_ids * 1.2, per_file),
+            'Comment': rng.choice(['', 'reviewed', 'pending review'], per_file),
+        })
+        with pd.ExcelWriter(os.path.join(directory, 'input', f'functions_{i:03d}.xlsx')) as writer:
+            df.to_excel(writer, sheet_name='Users', index=False)
+            pd.DataFrame({'Note': ['generated']}).to_excel(writer, sheet_name='Notes', index=False)
+
+    # Mapping workbook: several role names per ID, some matching the removal filter
+    mapping_rows = app_ids * 3
+    ids = rng.integers(0, app_ids, mapping_rows)
+    mapping = pd.DataFrame({
+        'Role Name': [f'{rng.choice(ROLE_PREFIXES)}_{k % 500:04d}' for k in range(mapping_rows)],
+        'ID': ids,
+        'ID Description': [f'Application {i}' for i in ids],
+        'Owner': rng.choice(['Team A', 'Team B'], mapping_rows),
+    })
+    with pd.ExcelWriter(os.path.join(directory, 'mapping.xlsx')) as writer:
+        mapping.to_excel(writer, sheet_name='Role-ID', index=False)
+        pd.DataFrame({'Version': [1]}).to_excel(writer, sheet_name='About', index=False)
+
+    return per_file * files
+
+
+def status_report(path, rows, seed=0):
+    '''Write the status report workbook: 4 title rows, then a header row and rows of tickets.'''
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Ticket': [f'T{j:08d}' for j in range(rows)],
+        'Status': rng.choice(STATUSES, rows),
+        'Priority': rng.choice(['P1', 'P2', 'P3', 'P4'], rows),
+        'Assignee': rng.choice([f'user{k}' for k in range(200)], rows),
+        'Opened': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24, rows), unit='h'),
+        'Summary': [f'Issue number {j}' for j in range(rows)],
+    })
+
+    # Title block that the pipeline skips with skiprows=4
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame([['Status Report'], ['Generated by benchmark'], [''], ['']]).to_excel(
+            writer, sheet_name='Report', index=False, header=False)
+        df.to_excel(writer, sheet_name='Report', index=False, startrow=4)
+
+    return rows
+
+
+def status_report_bytes(rows, seed=0):
+    '''Return the status report workbook as bytes, as it would arrive in an email attachment.'''
+    buffer = io.BytesIO()
+    status_report(buffer, rows, seed=seed)
+    return buffer.getvalue()
+
+
+def covid_csvs(directory, days, seed=0):
+    '''Write daily.csv with days x states rows and current.csv with one row per state, return paths.'''
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end='2021-03-07', periods=days, freq='D')
+    n = len(dates) * len(STATES)
+    daily = pd.DataFrame({
+        'date': np.repeat(dates.strftime('%Y%m%d').astype(int), len(STATES)),
+        'state': np.tile(STATES, len(dates)),
+        'positive': rng.integers(0, 3_000_000, n),
+        'negative': rng.integers(0, 30_000_000, n),
+        'hospitalizedCurrently': rng.integers(0, 20_000, n).astype(float),
+        'death': rng.integers(0, 60_000, n).astype(float),
+        'totalTestResults': rng.integers(0, 50_000_000, n),
+        'dataQualityGrade': rng.choice(['A', 'B', 'C', None], n),
+    }).sort_values(['date', 'state'], ascending=[False, True])
+    daily.loc[daily.sample(frac=0.05, random_state=seed).index, 'hospitalizedCurrently'] = np.nan
+    current = daily[daily['date'] == daily['date'].max()]
+
+    daily_path = os.path.join(directory, 'daily.csv')
+    current_path = os.path.join(directory, 'current.csv')
+    daily.to_csv(daily_path, index=False)
+    current.to_csv(current_path, index=False)
+    return daily_path, current_path
+
+
+def etl_database(path, rows, prod_rows=0, seed=0):
+    '''Create a SQLite stand-in for Teradata with a source table of rows, an empty temp table and a prod table.'''
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'id': np.arange(rows),
+        'event_date': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')).strftime('%Y-%m-%d'),
+        'category': rng.choice(['A', 'B', 'C', 'D'], rows),
+        'amount': rng.normal(100, 25, rows).round(2),
+        'note': [f'row {i}' for i in range(rows)],
+    })
+
+    with sqlite3.connect(path) as con:
+        # WAL lets the streaming extract read while the load writes, like separate Teradata sessions
+        con.execute('PRAGMA journal_mode=WAL')
+        columns = 'id INTEGER, event_date TEXT, category TEXT, amount REAL, note TEXT'
+        for table in ('src_table', 'temp_table', 'prod_table'):
+            con.execute(f'DROP TABLE IF EXISTS {table}')
+            con.execute(f'CREATE TABLE {table} ({columns})')
+        con.executemany('INSERT INTO src_table VALUES (?, ?, ?, ?, ?)', df.itertuples(index=False, name=None))
+        con.executemany('INSERT INTO prod_table VALUES (?, ?, ?, ?, ?)', df.head(prod_rows).itertuples(index=False, name=None))
+
+    return rows
+
+
+def zipcode_database(path, zipcodes=42000, seed=0):
+    '''Create a SQLite file shaped like the uszipcode simple_zipcode table with zipcodes rows, return the ZIP codes.'''
+    rng = np.random.default_rng(seed)
+    codes = np.sort(rng.choice(100000, zipcodes, replace=False))
+    lat = rng.uniform(25, 49, zipcodes).round(2)
+    lng = rng.uniform(-124, -67, zipcodes).round(2)
+    df = pd.DataFrame({
+        'zipcode': [f'{code:05d}' for code in codes],
+        'zipcode_type': rng.choice(['Standard', 'PO Box', 'Unique'], zipcodes, p=[0.8, 0.15, 0.05]),
+        'major_city': [f'City {code % 5000}' for code in codes],
+        'county': [f'County {code % 3000}' for code in codes],
+        'state': rng.choice(STATES, zipcodes),
+        'lat': lat,
+        'lng': lng,
+        'timezone': rng.choice(['Eastern', 'Central', 'Mountain', 'Pacific'], zipcodes),
+        'population': rng.integers(0, 100000, zipcodes),
+        'population_density': rng.uniform(0, 50000, zipcodes).round(1),
+        'median_home_value': rng.integers(50000, 1500000, zipcodes),
+        'median_household_income': rng.integers(20000, 250000, zipcodes),
+        # Boundary as JSON text, the heavy column the enrichment leaves out
+        'polygon': [str([[round(x + dx, 4), round(y + dy, 4)] for dx, dy in rng.uniform(-0.05, 0.05, (60, 2))])
+                    for x, y in zip(lng, lat)],
+    })
+
+    with sqlite3.connect(path) as con:
+        con.execute('DROP TABLE IF EXISTS simple_zipcode')
+        df.to_sql('simple_zipcode', con, index=False)
+        con.execute('CREATE UNIQUE INDEX ix_simple_zipcode_zipcode ON simple_zipcode (zipcode)')
+
+    return df['zipcode'].tolist()
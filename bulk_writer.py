@@ -0,0 +1,245 @@
+# Import dependences
+import os
+import time
+import logging
+import tempfile
+
+# Import dependences to manipulate data
+import pandas as pd
+
+
+# Base writer with the current behaviour: pandas to_sql sends one INSERT per row through ODBC
+class ToSqlWriter:
+    '''Write dataframes to a table with pandas to_sql.'''
+    name = 'to_sql'
+
+    def __init__(self, engine, table, batch_size=None, **kwargs):
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+
+        # Get database name and table name
+        self.schema, self.table_name = table.split('.') if '.' in table else (None, table)
+
+    def write(self, df):
+        '''Append dataframe to table, return rows written.'''
+        df.to_sql(name=self.table_name, con=self.engine, schema=self.schema, if_exists='append', index=False)
+        return len(df)
+
+    def close(self):
+        '''Finish writing, return rows written by close.'''
+        return 0
+
+
+# Send rows as parameter arrays, batch_size rows per executemany round trip
+class BatchedWriter(ToSqlWriter):
+    '''Write dataframes to a table with batched executemany parameter arrays.'''
+    name = 'batched'
+
+    def __init__(self, engine, table, batch_size=10000, **kwargs):
+        super().__init__(engine, table, batch_size=batch_size)
+
+    def insert_statement(self, columns):
+        '''Build parameterized INSERT statement in the paramstyle of the driver.'''
+        paramstyle = self.engine.dialect.paramstyle
+        if paramstyle == 'qmark':
+            markers = ['?'] * len(columns)
+        elif paramstyle == 'format':
+            markers = ['%s'] * len(columns)
+        elif paramstyle == 'numeric':
+            markers = [f':{i}' for i in range(1, len(columns) + 1)]
+        else:
+            raise ValueError(f'Unsupported paramstyle for batched insert: {paramstyle}')
+
+        # Quote column names that need it, e.g. Excel headers with spaces
+        quote = self.engine.dialect.identifier_preparer.quote
+        return f'''INSERT INTO {self.table} ({', '.join(quote(col) for col in columns)}) VALUES ({', '.join(markers)})'''
+
+    def write(self, df):
+        '''Append dataframe to table in batches in one transaction, return rows written.'''
+        if df.empty:
+            return 0
+
+        # Convert to python objects and replace NaN with NULL
+        values = []
+        for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                values.append([None if pd.isna(value) else value.to_pydatetime() for value in df[col]])
+            else:
+                values.append(df[col].astype(object).where(df[col].notna(), None).tolist())
+        rows = list(zip(*values))
+        sql = self.insert_statement(list(df.columns))
+
+        conn = self.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+
+            # Let pyodbc bind the whole batch as one parameter array
+            if hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True
+
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+
+            conn.commit()
+            cursor.close()
+
+        except Exception:
+
+            # Roll back so a fallback writer can resend the same chunk
+            conn.rollback()
+            raise
+
+        finally:
+            conn.close()
+
+        return len(rows)
+
+
+# Stage every chunk to one CSV file, then bulk load the file when writing is finished
+class FastLoadWriter(ToSqlWriter):
+    '''Write dataframes to a staged CSV file and bulk load it into the table on close.'''
+    name = 'fastload'
+
+    def __init__(self, engine, table, batch_size=None, loader=None, staging_dir=None, **kwargs):
+        super().__init__(engine, table, batch_size=batch_size)
+
+        # A loader is required, without one there is nothing to bulk load the file with
+        if loader is None:
+            raise ValueError('FastLoad writer requires a loader')
+        self.loader = loader
+
+        # Create staging file
+        fd, self.path = tempfile.mkstemp(prefix=f'{self.table_name}_', suffix='.csv', dir=staging_dir)
+        os.close(fd)
+        self.columns = None
+        self.row_count = 0
+
+    def write(self, df):
+        '''Append dataframe to the staging file, return 0 as nothing is in the table yet.'''
+        # Write header with the first chunk only
+        df.to_csv(self.path, mode='a', header=self.columns is None, index=False)
+        if self.columns is None:
+            self.columns = list(df.columns)
+        self.row_count += len(df)
+        return 0
+
+    def close(self):
+        '''Bulk load the staging file into the table, remove the file, return rows written.'''
+        # Keep the file if loading fails so it can be reloaded another way
+        if self.row_count > 0:
+            self.loader(self.path, self.table, self.columns)
+
+        os.remove(self.path)
+        return self.row_count
+
+
+# Create a function to read the warnings or errors of a FastLoad
+def fastload_messages(cur, function, insert):
+    '''Return non-empty messages of teradatasql escape function, teradata_get_warnings or teradata_get_errors, for insert.'''
+    cur.execute(f'{{fn teradata_nativesql}}{{fn {function}}}{insert}')
+    return [row[0] for row in cur.fetchall() if row and row[0]]
+
+
+# Create a loader that FastLoads a CSV file with the teradatasql driver
+def teradata_fastload_loader(connect):
+    '''Return loader function that FastLoads a staged CSV file on connections from connect.'''
+    def load(path, table, columns):
+        # Import here so the driver is only required when FastLoad is used
+        import teradatasql
+
+        with connect() as con:
+            with con.cursor() as cur:
+
+                # FastLoad must run in one transaction and commits once at the end
+                insert = f'''{{fn teradata_require_fastload}}{{fn teradata_read_csv({path})}}INSERT INTO {table} ({', '.join('?' for _ in columns)})'''
+                cur.execute('{fn teradata_nativesql}{fn teradata_autocommit_off}')
+                cur.execute(insert)
+
+                # Warnings and errors of a FastLoad are asked for with the INSERT that ran it
+                for warning in fastload_messages(cur, 'teradata_get_warnings', insert):
+                    logging.warning(f'FastLoad of {path} into {table}: {warning}')
+
+                # Rejected rows are errors, treat them as failure while the load can still be rolled back
+                errors = fastload_messages(cur, 'teradata_get_errors', insert)
+                if errors:
+                    con.rollback()
+                    raise teradatasql.Error('\n'.join(errors))
+
+                con.commit()
+
+                # Committed rows stay in the table, reloading them another way would write them twice
+                for error in fastload_messages(cur, 'teradata_get_errors', insert):
+                    logging.error(f'FastLoad of {path} into {table} failed to commit: {error}')
+
+    return load
+
+
+# Registry of available strategies
+WRITERS = {
+    ToSqlWriter.name: ToSqlWriter,
+    BatchedWriter.name: BatchedWriter,
+    FastLoadWriter.name: FastLoadWriter,
+}
+
+
+# Create a function to move rows staged by a failed FastLoad writer to the table with to_sql
+def reload_staged_file(writer, fallback):
+    '''Write the staging file of writer to the table with fallback writer, remove the file, return rows written.'''
+    row_count = 0
+    if writer.row_count > 0:
+        for df in pd.read_csv(writer.path, chunksize=writer.batch_size or 10000):
+            row_count += fallback.write(df)
+    os.remove(writer.path)
+    return row_count
+
+
+# Create a function to write dataframe chunks with the chosen strategy
+def write_chunks(chunks, table, engine, strategy='batched', batch_size=10000, **kwargs):
+    '''Write dataframe chunks to table with strategy, fall back to to_sql if it fails, return rows and columns written.'''
+    # Log info
+    logging.info(f'Trying to write to {table} with {strategy} writer')
+
+    start = time.perf_counter()
+    row_count = 0
+    columns = []
+
+    try:
+        writer = WRITERS[strategy](engine, table, batch_size=batch_size, **kwargs)
+    except Exception as e:
+
+        # Log warning and use current behaviour instead
+        logging.warning(f'Unable to use {strategy} writer, falling back to to_sql: {type(e).__name__}: {e}')
+        writer = ToSqlWriter(engine, table)
+
+    for df in chunks:
+        try:
+            row_count += writer.write(df)
+        except Exception as e:
+            if type(writer) is ToSqlWriter:
+                raise
+
+            # The failed chunk was rolled back, resend it and the rest with to_sql
+            logging.warning(f'{writer.name} writer failed, falling back to to_sql: {type(e).__name__}: {e}')
+            fallback = ToSqlWriter(engine, table)
+            if isinstance(writer, FastLoadWriter):
+                row_count += reload_staged_file(writer, fallback)
+            writer = fallback
+            row_count += writer.write(df)
+        columns = list(df.columns)
+
+    try:
+        row_count += writer.close()
+    except Exception as e:
+        if not isinstance(writer, FastLoadWriter):
+            raise
+
+        # Nothing was committed by the failed bulk load, reload the staged file with to_sql
+        logging.warning(f'{writer.name} load failed, falling back to to_sql: {type(e).__name__}: {e}')
+        row_count += reload_staged_file(writer, ToSqlWriter(engine, table))
+
+    # Log info
+    elapsed = time.perf_counter() - start
+    logging.info(f'Wrote {row_count} rows to {table} with {writer.name} writer in {elapsed:.2f}s')
+
+    return row_count, columns
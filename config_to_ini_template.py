@@ -2,11 +2,32 @@ from configparser import ConfigParser
 # Create Config
 config = ConfigParser()
 config['settings'] = {
+    'chunk_size': '50000',
+    'load_mode': 'append',
+    'bulk_strategy': 'batched',
+    'bulk_batch_size': '10000',
+    'resume_column': '',
+    'output_formats': 'csv, parquet',
+    'compact_frames': 'true'
+}
+
+config['retry'] = {
+    'max_attempts': '5',
+    'base_delay': '2',
+    'max_delay': '120',
+    'max_elapsed': '1800',
+    'jitter': '0.5'
 }
 
 config['files'] = {
     'log_file': 'Runtime_info.log',
-    'query_file': 'query.txt'
+    'log_max_bytes': '10485760',
+    'log_backup_count': '5',
+    'log_rotate_when': '',
+    'query_file': 'query.txt',
+    'state_file': 'etl_state.json',
+    'download_dir': '.cache/covid',
+    'staging_dir': '',
     'save_to_filepath': r'\\domain\network\path'
 }
 
@@ -17,12 +38,59 @@ config['emails'] = {
 
 config['database'] = {
     'user_dsn': 'tdprod',
+    'td_host': 'tdprod.domain.com',
+    'url': '',
+    'session_sql': 'SET SESSION CHARACTERISTICS AS TRANSACTION ISOLATION LEVEL READ UNCOMMITTED;',
     'td_driver': 'Teradata Database ODBC Driver 17.00',
     'temp_db': 'Database.Table',
     'prod_db': 'Database.Table',
     'port': '1025'
 }
 
+config['incremental'] = {
+    'business_key': '',
+    'watermark_column': ''
+}
+
+config['partition'] = {
+    'column': '',
+    'type': 'date',
+    'lower': '2020-01-01',
+    'upper': '2021-01-01',
+    'partitions': '4',
+    'workers': '4'
+}
+
+config['pool'] = {
+    'pool_size': '5',
+    'max_overflow': '2',
+    'pool_timeout': '300',
+    'pool_recycle': '3600'
+}
+
+config['checkpoint'] = {
+    'directory': '.checkpoints',
+    'retention_days': '7',
+    'max_age_hours': '24',
+    'finish_on_failure': 'true'
+}
+
+config['cache'] = {
+    'directory': '',
+    'ttl': '3600',
+    'max_bytes': '1073741824'
+}
+
+config['smtp'] = {
+    'host': 'smtp-mail.outlook.com',
+    'port': '587',
+    'starttls': 'true',
+    'batch_size': '20',
+    'idle_timeout': '30',
+    'compress_attachments': 'true',
+    'max_attachment_bytes': '2097152'
+}
+
 config['credentials'] = {
     'email_address': '',
     'email_password': '',
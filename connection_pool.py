@@ -0,0 +1,101 @@
+# Import dependences
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Import dependences to interact with database
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+
+# Stage of the current thread and connection statistics per stage
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+
+
+def current_stage():
+    '''Return stage name of the current thread.'''
+    return getattr(_local, 'stage', None) or 'unassigned'
+
+
+def _record(stage, key, value=1):
+    '''Add value to a statistic of stage.'''
+    with _lock:
+        stats = _stats.setdefault(stage, {'checkouts': 0, 'logons': 0, 'wait': 0.0, 'max_wait': 0.0})
+        if key == 'wait':
+            stats['wait'] += value
+            stats['max_wait'] = max(stats['max_wait'], value)
+        else:
+            stats[key] += value
+
+
+# Time how long every checkout from the pool takes, including a new logon when the pool is empty
+class TimedQueuePool(QueuePool):
+    '''QueuePool that records connection acquisition latency per stage.'''
+
+    def connect(self):
+        start = time.perf_counter()
+        conn = super().connect()
+        stage = current_stage()
+        _record(stage, 'checkouts')
+        _record(stage, 'wait', time.perf_counter() - start)
+        return conn
+
+
+@contextmanager
+def pool_stage(name):
+    '''Attribute connections acquired by the current thread inside the block to stage name.'''
+    previous = getattr(_local, 'stage', None)
+    _local.stage = name
+    try:
+        yield
+    finally:
+        _local.stage = previous
+
+
+# Create a function to create an engine with a managed connection pool
+def create_pooled_engine(url, pool_size=5, max_overflow=5, pool_timeout=60, pool_recycle=3600, session_statements=(), **kwargs):
+    '''Create engine with explicit pool sizing and pre-ping, run session_statements on every new pooled connection, return engine.'''
+    engine = create_engine(url,
+                           poolclass=TimedQueuePool,
+                           pool_size=pool_size,
+                           max_overflow=max_overflow,
+                           pool_timeout=pool_timeout,
+                           pool_recycle=pool_recycle,
+                           pool_pre_ping=True,
+                           **kwargs)
+
+    # Session settings live as long as the database session, so set them once when the pool opens a connection
+    @event.listens_for(engine, 'connect')
+    def setup_session(dbapi_connection, connection_record):
+        _record(current_stage(), 'logons')
+        if session_statements:
+            cursor = dbapi_connection.cursor()
+            for statement in session_statements:
+                cursor.execute(statement)
+            cursor.close()
+            dbapi_connection.commit()
+
+    return engine
+
+
+def connection_stats():
+    '''Return a copy of the connection statistics per stage.'''
+    with _lock:
+        return {stage: dict(stats) for stage, stats in _stats.items()}
+
+
+def reset_connection_stats():
+    '''Clear the connection statistics.'''
+    with _lock:
+        _stats.clear()
+
+
+def log_connection_stats():
+    '''Log connection acquisition latency of every stage.'''
+    for stage, stats in connection_stats().items():
+        average = stats['wait'] / stats['checkouts'] * 1000 if stats['checkouts'] else 0
+        logging.info(f'''Connections for stage '{stage}': {stats['checkouts']} checkouts, {stats['logons']} logons, '''
+                     f'''avg wait {average:.1f}ms, max wait {stats['max_wait'] * 1000:.1f}ms''')
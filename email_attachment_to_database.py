@@ -4,6 +4,15 @@ import os
 # Import dependence to log progress
 import logging
 
+# Import dependences to remember the last ingested attachment
+import hashlib
+from datetime import datetime
+from collections import deque
+from itertools import islice
+
+# Import dependence to ingest several emails at once
+from concurrent.futures import ThreadPoolExecutor
+
 # Import dependence to disable InsecureRequestWarning
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -12,21 +21,37 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 from configparser import ConfigParser
 
 # Import dependences to read email via exchange protocol
-from exchangelib import Credentials, Configuration, Account, DELEGATE
+from exchangelib import Credentials, Configuration, Account, DELEGATE, EWSDateTime
 from exchangelib.protocol import BaseProtocol, NoVerifyHTTPAdapter
 BaseProtocol.HTTP_ADAPTER_CLS = NoVerifyHTTPAdapter
 
+# Import dependences to retry transient failures
+from exchangelib.errors import TransportError, ErrorServerBusy
+from retry_policy import RetryPolicy
+
+# Import dependence to measure stages
+from instrumentation import configure, stage, run_summary, configure_logging, run_log_file
+
 # Import dependences to manipulate data
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.types import NVARCHAR
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.types import NVARCHAR, BigInteger, Boolean, DateTime, Float, Integer, Numeric, String
+from collections import Counter
+
+# Import dependence to bulk insert into the staging table
+from bulk_writer import write_chunks
+
+# Import dependence to read only the open tickets of the report
+from excel_reader import read_filtered
 
-# Import dependences to send email with MIME
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+# Import dependence to shrink dataframes after reading
+from frame_compaction import compact
+
+# Import dependence to remember the last ingested attachment
+from run_state import read_state, save_state
+
+# Import dependence to send notification emails
+from notifier import Notifier
 
 
 # Initiate variables from config
@@ -34,9 +59,9 @@ parser = ConfigParser()
 parser.read('HOS.ini')
 email_address = parser.get('credentials', 'email_address')
 email_password = parser.get('credentials', 'email_password')
-email_recipient = parser.get('credentials', 'email_recipient')
 email_from_subject = parser.get('emails', 'email_from_subject')
 email_to_subject = parser.get('emails', 'email_to_subject')
+email_to_error_subject = parser.get('emails', 'email_to_error_subject', fallback='ERROR OCCURRED')
 download_file_name = parser.get('files', 'download_file_name')
 download_location = parser.get('files', 'download_location')
 log_file = parser.get('files', 'log_file')
@@ -44,114 +69,419 @@ email_server = parser.get('settings', 'email_server')
 db_host = parser.get('db', 'db_host')
 db_name = parser.get('db', 'db_name')
 db_table_name = parser.get('db', 'db_table_name')
+state_file = parser.get('files', 'state_file', fallback='email_state.json')
+download_chunk_size = parser.getint('settings', 'download_chunk_size', fallback=2 ** 20)
+ingest_mode = parser.get('settings', 'ingest_mode', fallback='latest')
+ingest_workers = parser.getint('settings', 'ingest_workers', fallback=4)
+page_size = parser.getint('settings', 'page_size', fallback=100)
+backlog_start = parser.get('settings', 'backlog_start', fallback='')
+db_url = parser.get('db', 'db_url', fallback='mssql+pyodbc://' + db_host + '/' + db_name + '?driver=SQL+Server+Native+Client+11.0')
+open_statuses = [status.strip() for status in parser.get('settings', 'open_statuses', fallback='In Progress, New, Pending Acknowledgement').split(',')]
+read_columns = [col.strip() for col in parser.get('settings', 'read_columns', fallback='').split(',') if col.strip()]
+read_batch_size = parser.getint('settings', 'read_batch_size', fallback=10000)
+compact_frames = parser.getboolean('settings', 'compact_frames', fallback=True)
+merge_key = [key.strip() for key in parser.get('db', 'merge_key', fallback='').split(',') if key.strip()]
+load_mode = parser.get('db', 'load_mode', fallback='merge' if merge_key else 'replace')
+load_batch_size = parser.getint('db', 'load_batch_size', fallback=10000)
+retry_policy = RetryPolicy.from_config(parser, retryable=(TransportError, ErrorServerBusy))
+notifier = Notifier.from_config(parser, retry_policy=retry_policy)
+
 
+# Configure logging information, rotate the log file and keep this run's lines for emails
+configure_logging(log_file, max_bytes=parser.getint('files', 'log_max_bytes', fallback=10 * 2 ** 20),
+                  backup_count=parser.getint('files', 'log_backup_count', fallback=5),
+                  when=parser.get('files', 'log_rotate_when', fallback=None))
 
-# Configure logging information
-logging.basicConfig(level=logging.INFO, filename=log_file, filemode='a', 
-                    format='%(asctime)s -%(levelname)s- %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+# Write stage metrics next to the log file
+configure(log_file, job='email_attachment_to_database')
 
 
 # Specify download path for attachment 
 download_path = os.path.join(download_location, download_file_name)
 
 
+# Create a function to stream an attachment to disk
+def stream_attachment(attachment, path, chunk_size=download_chunk_size):
+    '''Write attachment content to path in chunks, return sha256 hex digest of the content.'''
+    digest = hashlib.sha256()
+
+    # Write to a partial file first so a broken download never replaces the last good file
+    with attachment.fp as fp, open(f'{path}.part', 'wb') as f:
+        for block in iter(lambda: fp.read(chunk_size), b''):
+            digest.update(block)
+            f.write(block)
+
+    return f'{path}.part', digest.hexdigest()
+
+
+# Create a function to connect to the mailbox
+def connect_account():
+    '''Return Exchange account of email_address, retry transient failures.'''
+    creds = Credentials(username=email_address,password=email_password)
+    config = Configuration(server=email_server, credentials=creds)
+    return retry_policy.run(Account
+                            , primary_smtp_address=email_address
+                            , config=config
+                            , autodiscover=False
+                            , access_type=DELEGATE
+                            , description='Connecting to Exchange')
+
+
 # Download email attachment from user
 def download_email_attachment():
     
+    # Nothing new until an attachment is downloaded
+    download_email_attachment.subject = None
+    download_email_attachment.attachment = None
+    download_email_attachment.failed = False
+
     try:
         # Initiate variables to read inbox
-        creds = Credentials(username=email_address,password=email_password)
-        config = Configuration(server=email_server, credentials=creds)
-        account = Account(primary_smtp_address=email_address
-                          , config=config
-                          , autodiscover=False
-                          , access_type=DELEGATE)
-
-        # Filter emails with specific subject
-        filter_email = account.inbox.filter(subject__startswith=email_from_subject)
+        account = connect_account()
+
+        # Filter emails with specific subject, fetch only the fields needed to find the attachment
+        filter_email = account.inbox.filter(subject__startswith=email_from_subject).only('subject', 'datetime_received', 'attachments')
+        
+        # Fetch the latest email from filtered email, retry transient Exchange failures
+        messages = retry_policy.run(lambda: list(filter_email.order_by('-datetime_received')[:1]), description='Fetching email')
+        state = read_state(state_file)
         
-        # Fetch the latest email from filtered email & download the attachment to local drive
-        for msg in filter_email.order_by('-datetime_received')[:1]:
+        # Download the attachment to local drive
+        for msg in messages:
             
             # Create a function attribute
             download_email_attachment.subject = msg.subject
             
-            for i in range(len(msg.attachments)):
-                
-                # Business requirement: only 1 xlsx should be attached in the email
-                if msg.attachments[i].name.endswith('.xlsx'):
-                    with open(download_path, 'wb') as f:
-                        f.write(msg.attachments[i].content)
+            # Business requirement: only 1 xlsx should be attached in the email
+            for attachment in msg.attachments:
+                if not attachment.name.endswith('.xlsx'):
+                    continue
 
-        # Log info
-        logging.info(f"Downloaded email attachment from '{download_email_attachment.subject}'")
+                # Same attachment as last run: nothing to download
+                attachment_id = attachment.attachment_id.id
+                if attachment_id == state.get('attachment_id'):
+                    logging.info(f"Attachment '{attachment.name}' from '{msg.subject}' is already ingested, skipped download")
+                    continue
+
+                # Stream content to disk, retry transient Exchange failures
+                part_path, content_hash = retry_policy.run(stream_attachment, attachment, download_path, description='Downloading attachment')
+
+                # Same content sent again in a new email: nothing to import
+                if content_hash == state.get('sha256'):
+                    os.remove(part_path)
+                    save_state({**state, 'attachment_id': attachment_id}, state_file)
+                    logging.info(f"Attachment '{attachment.name}' from '{msg.subject}' has the same content as the last ingested one, skipped import")
+                    continue
+
+                os.replace(part_path, download_path)
+                download_email_attachment.attachment = {'attachment_id': attachment_id, 'sha256': content_hash,
+                                                        'name': attachment.name, 'subject': msg.subject,
+                                                        'received': msg.datetime_received.isoformat()}
+
+                # Log info
+                logging.info(f"Downloaded email attachment from '{download_email_attachment.subject}'")
         
     except Exception as e:
         
-        # Log error
+        # Log error, the run is reported as failed instead of as nothing new
         logging.error("Exception occurred", exc_info=True)
+        download_email_attachment.failed = True
+        download_email_attachment.attachment = None
 
 
         
+# Create a function to read the open tickets of a status report
+def read_data(path):
+    '''Return rows of the status report at path whose status is still open.'''
+    # Filter rows and columns while the sheet is read, so only open tickets are ever held in memory
+    batches = read_filtered(path, skiprows=4, filter_column='Status', keep_values=open_statuses,
+                            columns=read_columns, batch_size=read_batch_size)
+    data = pd.concat(batches, ignore_index=True).infer_objects()
+
+    # Repeated text such as Status is held as categories
+    return compact(data, os.path.basename(path)) if compact_frames else data
+
+
+# Create a function to infer column types from the sheet
+def infer_sql_types(data):
+    '''Return SQL type per column of data, text columns sized to their longest value.'''
+    types = {}
+    for col in data:
+        if pd.api.types.is_bool_dtype(data[col]):
+            types[col] = Boolean()
+        elif pd.api.types.is_integer_dtype(data[col]):
+            types[col] = BigInteger()
+        elif pd.api.types.is_float_dtype(data[col]):
+            types[col] = Float()
+        elif pd.api.types.is_datetime64_any_dtype(data[col]):
+            types[col] = DateTime()
+        else:
+            # Never narrower than the NVARCHAR(255) used so far, longer text gets the next power of two
+            length = data[col].dropna().astype(str).str.len().max()
+            length = 255 if pd.isna(length) or length <= 255 else 2 ** int(length - 1).bit_length()
+            types[col] = NVARCHAR(length=length if length <= 4000 else None)
+    return types
+
+
+# Create a function to group SQL types the way widening compares them
+def type_kind(sql_type):
+    '''Return the generic type class of sql_type: Boolean, Integer, Numeric, DateTime or String, None for others.'''
+    for kind in (Boolean, Integer, Numeric, DateTime, String):
+        if isinstance(sql_type, kind):
+            return kind
+    return None
+
+
+# Create a function to find the column type that holds the table's and the report's values
+def wider_type(current, needed):
+    '''Return type to change a column of type current to so it also holds values of type needed, None if it already does.'''
+    current_kind, needed_kind = type_kind(current), type_kind(needed)
+
+    # Text: only grow, NVARCHAR(max) has no length
+    if current_kind is String and needed_kind is String:
+        if current.length is None or (needed.length is not None and needed.length <= current.length):
+            return None
+        return NVARCHAR(length=needed.length)
+    if current_kind is String:
+        return None if current.length is None or current.length >= 255 else NVARCHAR(length=255)
+    if current_kind is needed_kind or (current_kind, needed_kind) in ((Integer, Boolean), (Numeric, Boolean), (Numeric, Integer)):
+        return None
+
+    # Numbers widen to BIGINT or FLOAT, any other change, e.g. numbers now mixed with text, needs text
+    if needed_kind is not String and {current_kind, needed_kind} <= {Boolean, Integer}:
+        return BigInteger()
+    if needed_kind is not String and {current_kind, needed_kind} <= {Boolean, Integer, Numeric}:
+        return Float()
+    return needed if needed_kind is String else NVARCHAR(length=255)
+
+
+# Create a function to make the table hold the columns of a new report
+def widen_table(engine, types):
+    '''Add missing columns and widen columns too narrow for types, return the table's column types for the staging table.'''
+    quote = engine.dialect.identifier_preparer.quote
+    existing = {col['name']: col['type'] for col in inspect(engine).get_columns(db_table_name)}
+
+    table_types = {}
+    with engine.begin() as conn:
+        for col, needed in types.items():
+            # Column is new in this report
+            if col not in existing:
+                conn.execute(f'ALTER TABLE {db_table_name} ADD {quote(col)} {needed.compile(dialect=engine.dialect)} NULL')
+                logging.info(f'Added column {col} {needed.compile(dialect=engine.dialect)} to {db_table_name}')
+                table_types[col] = needed
+                continue
+
+            # Longer text or another type than the first report had would make the MERGE fail
+            wider = wider_type(existing[col], needed)
+            if wider is not None:
+                conn.execute(f'ALTER TABLE {db_table_name} ALTER COLUMN {quote(col)} {wider.compile(dialect=engine.dialect)} NULL')
+                logging.info(f'Widened column {col} of {db_table_name} from {existing[col]} to {wider.compile(dialect=engine.dialect)}')
+            table_types[col] = wider if wider is not None else existing[col]
+
+    return table_types
+
+
+# Create a function to merge a status report into the table by key
+def merge_data(data, engine):
+    '''Bulk insert data into a staging table, merge it into the table by merge_key, return counts per action.'''
+    staging = f'{db_table_name}_staging'
+    quote = engine.dialect.identifier_preparer.quote
+
+    # MERGE fails when a target row matches several source rows, keep the last row per key
+    duplicates = data.duplicated(merge_key, keep='last')
+    if duplicates.any():
+        logging.warning(f"Dropped {duplicates.sum()} rows with duplicate {', '.join(merge_key)}")
+        data = data[~duplicates]
+
+    # Create the table on the first run, later widen it to this report, stage with the table's column types
+    types = infer_sql_types(data)
+    if inspect(engine).has_table(db_table_name):
+        types = widen_table(engine, types)
+    else:
+        data.head(0).to_sql(db_table_name, engine, if_exists='append', index=False, dtype=types)
+    data.head(0).to_sql(staging, engine, if_exists='replace', index=False, dtype=types)
+    write_chunks([data], staging, engine, strategy='batched', batch_size=load_batch_size)
+
+    # Update changed rows, insert new ones and delete tickets that are no longer open, all in one transaction
+    columns = [quote(col) for col in data.columns]
+    keys = [quote(key) for key in merge_key]
+    update_cols = [col for col in columns if col not in keys]
+    on_clause = ' AND '.join(f'tgt.{key} = src.{key}' for key in keys)
+    # EXCEPT compares NULLs as equal, so unchanged rows are not rewritten
+    matched = f'''WHEN MATCHED AND EXISTS (SELECT {', '.join(f'src.{col}' for col in update_cols)}
+                                        EXCEPT SELECT {', '.join(f'tgt.{col}' for col in update_cols)})
+                  THEN UPDATE SET {', '.join(f'{col} = src.{col}' for col in update_cols)}''' if update_cols else ''
+    with engine.begin() as conn:
+        result = conn.execute(f'''MERGE INTO {db_table_name} WITH (HOLDLOCK) AS tgt
+                                  USING {staging} AS src
+                                  ON {on_clause}
+                                  {matched}
+                                  WHEN NOT MATCHED BY TARGET THEN INSERT ({', '.join(columns)})
+                                  VALUES ({', '.join(f'src.{col}' for col in columns)})
+                                  WHEN NOT MATCHED BY SOURCE THEN DELETE
+                                  OUTPUT $action;''')
+        actions = Counter(row[0] for row in result)
+        conn.execute(f'DROP TABLE {staging}')
+
+    # Log info
+    logging.info(f"Merged into {db_table_name}: {actions['INSERT']} inserted, {actions['UPDATE']} updated, {actions['DELETE']} deleted")
+    return actions
+
+
+# Create a function to load a status report into SQL server
+def load_data(data):
+    '''Merge data into the database table by merge_key, or replace the table when no key is configured.'''
+    # Create mssql engine connection
+    engine = create_engine(db_url, **({'fast_executemany': True} if db_url.startswith('mssql+pyodbc') else {}))
+    try:
+        if load_mode == 'merge':
+            merge_data(data, engine)
+        else:
+            data.to_sql(db_table_name, engine, if_exists='replace', index=False, dtype={col_name: NVARCHAR(length=255) for col_name in data})
+    finally:
+        engine.dispose()
+
+
 # Import data from local drive to SQL server
 def import_data():
-    try:
-        # Create mssql engine connection
-        engine = create_engine('mssql+pyodbc://' + db_host + '/' + db_name + '?driver=SQL+Server+Native+Client+11.0', fast_executemany=True)
-        
-        # Read and filter data
-        data = pd.read_excel(download_path,skiprows=4)
-        data = data[data['Status'].isin(['In Progress', 'New', 'Pending Acknowledgement'])]
 
-        # Import data to mssql server
-        data.to_sql(db_table_name, engine, if_exists='replace', index=False, dtype={col_name: NVARCHAR(length=255) for col_name in data})
+    # Nothing imported until the data is loaded
+    import_data.count = 0
+    import_data.failed = False
+
+    try:
+        # Read, filter and import data to mssql server
+        data = read_data(download_path)
+        load_data(data)
         
         # Create a function attribute
         import_data.count = len(data)
         
         # Log info
         logging.info(f"Imported {len(data)} lines of data")
+
+        # Remember the attachment so the same email is not downloaded again
+        state = save_state(download_email_attachment.attachment, state_file)
+        logging.info(f"Saved ingested attachment state of '{state.get('name')}'")
         
     except Exception as e:
         
-        # Log error
+        # Log error, the run is reported as failed instead of as imported
         logging.error("Exception occurred", exc_info=True)
+        import_data.failed = True
+
+
+        
+# Create a function to list every matching email newer than the cursor
+def fetch_new_messages(account, cursor):
+    '''Return emails received since the cursor, oldest first, without the ones the cursor already covers.'''
+    query = account.inbox.filter(subject__startswith=email_from_subject)
+
+    # Emails received at the cursor time are fetched again and skipped by id, so none sharing that time is lost
+    if cursor.get('received'):
+        query = query.filter(datetime_received__gte=EWSDateTime.from_datetime(datetime.fromisoformat(cursor['received'])))
+    query = query.only('subject', 'datetime_received', 'attachments').order_by('datetime_received')
+
+    # Exchange returns the result in pages of page_size items
+    query.page_size = page_size
+    messages = retry_policy.run(lambda: list(query), description='Fetching emails')
+    return [msg for msg in messages if msg.id not in cursor.get('message_ids', [])]
+
+
+# Create a function to download and read the report of one email, run in the worker pool
+def prepare_message(msg, index):
+    '''Return (attachment state, data) of the xlsx attached to msg, (None, None) if it has none.'''
+    for attachment in msg.attachments:
+        if attachment.name.endswith('.xlsx'):
+            stem, ext = os.path.splitext(download_path)
+            part_path, content_hash = retry_policy.run(stream_attachment, attachment, f'{stem}_{index}{ext}', description='Downloading attachment')
+            try:
+                data = read_data(part_path)
+            finally:
+                os.remove(part_path)
+            state = {'attachment_id': attachment.attachment_id.id, 'sha256': content_hash, 'name': attachment.name,
+                     'subject': msg.subject, 'received': msg.datetime_received.isoformat()}
+            return state, data
+
+    return None, None
+
+
+# Create a function to find where the first backlog run starts
+def start_cursor(state):
+    '''Return cursor at the email latest mode ingested last, else at backlog_start, raise ValueError when there is neither.'''
+    # The email ingested last is fetched again and skipped by its content hash
+    if state.get('received'):
+        return {'received': state['received'], 'message_ids': []}
+    if backlog_start:
+        start = datetime.fromisoformat(backlog_start)
+        return {'received': (start if start.tzinfo else start.astimezone()).isoformat(), 'message_ids': []}
+    raise ValueError('No email is ingested yet, set backlog_start in [settings] to the date to ingest emails from')
+
+
+# Create a function to advance the cursor past an email
+def advance_cursor(cursor, msg):
+    '''Return cursor that covers msg and every email before it.'''
+    received = msg.datetime_received.isoformat()
+    message_ids = cursor.get('message_ids', []) if cursor.get('received') == received else []
+    return {'received': received, 'message_ids': message_ids + [msg.id]}
+
+
+# Ingest every email received since the last run
+def ingest_backlog():
+
+    # Nothing imported until an email is loaded
+    ingest_backlog.count = 0
+    ingest_backlog.emails = 0
+    ingest_backlog.subject = None
+    ingest_backlog.failed = False
+
+    try:
+        state = read_state(state_file)
+        cursor = state.get('cursor') or start_cursor(state)
+        account = connect_account()
+        messages = fetch_new_messages(account, cursor)
+        logging.info(f"Found {len(messages)} new emails")
+
+        # Download and read up to ingest_workers emails at a time, load them one by one in received order
+        with ThreadPoolExecutor(max_workers=ingest_workers) as executor:
+            queue = iter(enumerate(messages))
+            pending = deque((msg, executor.submit(prepare_message, msg, index)) for index, msg in islice(queue, ingest_workers))
+            while pending:
+
+                # Oldest email first so the table ends up with the latest report
+                msg, future = pending.popleft()
+                attachment, data = future.result()
+
+                # Keep the pool busy while loading
+                for index, next_msg in islice(queue, 1):
+                    pending.append((next_msg, executor.submit(prepare_message, next_msg, index)))
+
+                # Same content as the last ingested report: nothing to load
+                if attachment and attachment['sha256'] != state.get('sha256'):
+                    load_data(data)
+                    ingest_backlog.count = len(data)
+                    ingest_backlog.emails += 1
+                    ingest_backlog.subject = msg.subject
+                    logging.info(f"Imported {len(data)} lines of data from '{msg.subject}' received {attachment['received']}")
+                    state = {**state, **attachment}
+
+                # Advance the cursor only after the load succeeded
+                cursor = advance_cursor(cursor, msg)
+                save_state({**state, 'cursor': cursor}, state_file)
+
+    except Exception as e:
+
+        # Log error, the cursor stays at the last email that was loaded
+        logging.error("Exception occurred", exc_info=True)
+        ingest_backlog.failed = True
 
 
         
 # Send email notification with log attached
 def send_email_log(subject, body, filename):
     try:
-        # Construct email object
-        msg = MIMEMultipart()
-        msg['From'] = email_address
-        msg['To'] = email_address
-        msg['Subject'] = subject
-        
-        # Send plain text (can send html etc)
-        msg.attach(MIMEText(body,'plain'))
-        
-        # Send email with attachments (text, image etc)
-        attachment = open(filename, 'rb')
-        part = MIMEBase('application', 'octat-stream')
-        part.set_payload(attachment.read())
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', "attachment; filename= " + filename)
-        msg.attach(part)
-        
-        # Convert msg object into string
-        text = msg.as_string()
-        
-        # Send email via SMTP server and logout when done
-        server = smtplib.SMTP('smtp-mail.outlook.com:587')
-        server.starttls()
-        server.ehlo()
-        server.login(email_address, email_password)
-        server.sendmail(email_address, email_recipient, text)
-        server.quit()
-        
-        # Log info
-        logging.info(f"Email notification is sent to {email_recipient}")
+        # Queue email with this run's log lines as they are now, it is sent in the background
+        notifier.send(subject, body, attachment=run_log_file(filename), full_path=filename)
         
     except Exception as e:
         
@@ -159,8 +489,39 @@ def send_email_log(subject, body, filename):
         logging.error("Exception occurred", exc_info=True)
 
         
-# Call functions        
-download_email_attachment()        
-import_data()
-msg = f"{import_data.count} lines of data are imported to table '{db_table_name}' from email '{download_email_attachment.subject}'"
-send_email_log(email_to_subject, msg, log_file)
+# Call functions
+if ingest_mode == 'backlog':
+    with stage('ingest_backlog') as s:
+        ingest_backlog()
+        s.add(rows=ingest_backlog.count)
+    msg = f"{ingest_backlog.emails} emails are imported to table '{db_table_name}', {ingest_backlog.count} lines of data from latest email '{ingest_backlog.subject}'\n\n{run_summary()}"
+    if ingest_backlog.failed:
+        msg = f"Unable to ingest every new email, check log. {msg}"
+    send_email_log(email_to_error_subject if ingest_backlog.failed else email_to_subject, msg, log_file)
+
+else:
+    with stage('download_email_attachment') as s:
+        download_email_attachment()
+        if download_email_attachment.attachment:
+            s.add(bytes=os.path.getsize(download_path))
+
+    # Import only when a new attachment was downloaded
+    subject = email_to_subject
+    if download_email_attachment.failed:
+        subject = email_to_error_subject
+        msg = f"Unable to download the attachment of the latest '{email_from_subject}' email, check log\n\n{run_summary()}"
+    elif download_email_attachment.attachment:
+        with stage('import_data') as s:
+            import_data()
+            s.add(rows=import_data.count)
+        if import_data.failed:
+            subject = email_to_error_subject
+            msg = f"Unable to import the attachment of email '{download_email_attachment.subject}' to table '{db_table_name}', check log\n\n{run_summary()}"
+        else:
+            msg = f"{import_data.count} lines of data are imported to table '{db_table_name}' from email '{download_email_attachment.subject}'\n\n{run_summary()}"
+    else:
+        msg = f"No new attachment to import to table '{db_table_name}', latest email '{download_email_attachment.subject}' is already ingested\n\n{run_summary()}"
+    send_email_log(subject, msg, log_file)
+
+# Send queued emails and log out of the mail server
+notifier.close()
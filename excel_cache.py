@@ -0,0 +1,154 @@
+# Import dependences
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# Import dependences to manipulate data
+import pandas as pd
+
+
+# Create a function to hash file content
+def file_hash(path, block_size=2 ** 20):
+    '''Return sha256 hex digest of file content.'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Create a function to pick the fastest installed Excel reader
+def excel_engine():
+    '''Return 'calamine' when python-calamine is installed and pandas supports it, else None for the pandas default.'''
+    try:
+        import python_calamine
+    except ImportError:
+        return None
+
+    # pandas reads with calamine from version 2.2
+    major, minor = (int(part) for part in pd.__version__.split('.')[:2])
+    return 'calamine' if (major, minor) >= (2, 2) else None
+
+
+# Create a function to parse one workbook, run in worker processes
+def parse_workbook(path, read_kwargs):
+    '''Return workbook at path as dataframe.'''
+    return pd.read_excel(path, **read_kwargs)
+
+
+class ExcelParseCache:
+    '''Cache parsed workbooks as Feather files keyed by content hash, so unchanged workbooks are never parsed twice.'''
+
+    def __init__(self, cache_dir='.cache/excel'):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Manifest maps source path to its mtime, size, content hash and cache file
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, content_hash, read_kwargs):
+        '''Return cache key of content read with read_kwargs.'''
+        options = json.dumps(read_kwargs, sort_keys=True, default=str)
+        return hashlib.sha256(f'{content_hash}:{options}'.encode()).hexdigest()[:32]
+
+    def lookup(self, path, **read_kwargs):
+        '''Return (key, cached dataframe or None) for the workbook at path.'''
+        stat = os.stat(path)
+        entry = self.manifest.get(os.path.abspath(path))
+
+        # Unchanged mtime and size: trust the saved hash instead of reading the file again
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            content_hash = entry['hash']
+        else:
+            content_hash = file_hash(path)
+
+        key = self._key(content_hash, read_kwargs)
+        self.manifest[os.path.abspath(path)] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': content_hash,
+                                                'key': key}
+
+        for ext, reader in (('feather', pd.read_feather), ('pkl', pd.read_pickle)):
+            cache_file = os.path.join(self.cache_dir, f'{key}.{ext}')
+            if os.path.exists(cache_file):
+                return key, reader(cache_file)
+
+        return key, None
+
+    def store(self, key, df):
+        '''Save parsed dataframe under key, as Feather when Arrow can hold its columns, else as pickle.'''
+        try:
+            df.reset_index(drop=True).to_feather(os.path.join(self.cache_dir, f'{key}.feather'))
+        except Exception:
+            # Excel columns with mixed types or non-string headers cannot be written to Arrow
+            path = os.path.join(self.cache_dir, f'{key}.feather')
+            if os.path.exists(path):
+                os.remove(path)
+            df.to_pickle(os.path.join(self.cache_dir, f'{key}.pkl'))
+
+    def read_excel(self, path, **read_kwargs):
+        '''Return workbook at path as dataframe, parsed only when it is new or changed.'''
+        key, df = self.lookup(path, **read_kwargs)
+        if df is not None:
+            self.hits += 1
+            return df
+
+        self.misses += 1
+        df = pd.read_excel(path, **read_kwargs)
+        self.store(key, df)
+        return df
+
+    def read_many(self, paths, workers=1, **read_kwargs):
+        '''Return workbooks at paths as dataframes in the order of paths, parse new or changed ones on a process pool.'''
+        keys = []
+        dfs = []
+        for path in paths:
+            key, df = self.lookup(path, **read_kwargs)
+            keys.append(key)
+            dfs.append(df)
+
+        # Parse every workbook missing from the cache, in parallel when there is more than one
+        missing = [i for i, df in enumerate(dfs) if df is None]
+        self.hits += len(paths) - len(missing)
+        self.misses += len(missing)
+        if workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+                parsed = executor.map(parse_workbook, [paths[i] for i in missing], [read_kwargs] * len(missing))
+                for i, df in zip(missing, parsed):
+                    dfs[i] = df
+                    self.store(keys[i], df)
+        else:
+            for i in missing:
+                dfs[i] = parse_workbook(paths[i], read_kwargs)
+                self.store(keys[i], dfs[i])
+
+        return dfs
+
+    def evict(self, keep_paths):
+        '''Drop manifest entries of sources not in keep_paths and delete cache files nobody uses anymore.'''
+        keep = {os.path.abspath(p) for p in keep_paths}
+        for source in [s for s in self.manifest if s not in keep]:
+            del self.manifest[source]
+
+        used = {entry['key'] for entry in self.manifest.values()}
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext in ('.feather', '.pkl') and key not in used:
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def save(self):
+        '''Write the manifest so the next run can reuse the cache.'''
+        with open(f'{self.manifest_path}.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f'{self.manifest_path}.tmp', self.manifest_path)
+        logging.info(f'Excel parse cache: {self.hits} hits, {self.misses} misses')
@@ -0,0 +1,77 @@
+# Import dependences
+import os
+import logging
+
+
+# Output formats write_outputs understands
+FORMATS = ('xlsx', 'parquet', 'csv')
+
+
+# Create a function to read the format option
+def parse_formats(value):
+    '''Return formats listed in a comma separated option, e.g. "xlsx, parquet".'''
+    formats = [f.strip().lower() for f in value.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise ValueError(f'Unknown output format {", ".join(unknown)}, expected some of {", ".join(FORMATS)}')
+    return formats
+
+
+# Create a function to write sheets with xlsxwriter in constant memory mode
+def write_excel(sheets, path, chunk_size=10000):
+    '''Write dict of sheet name to dataframe into an xlsx file row by row, keeping only one row in memory.'''
+    import xlsxwriter
+
+    # Constant memory mode flushes each row as soon as the next one starts, so rows must be written in order
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False,
+                                          'strings_to_formulas': False, 'nan_inf_to_errors': True,
+                                          'remove_timezone': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    try:
+        for sheet_name, df in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(column) for column in df.columns], header_format)
+
+            # Convert one chunk at a time to Python values with blanks for missing cells
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start:start + chunk_size].astype(object)
+                rows = chunk.where(chunk.notna(), None).to_numpy().tolist()
+                for offset, row in enumerate(rows, start=start + 1):
+                    worksheet.write_row(offset, 0, row)
+    finally:
+        workbook.close()
+
+    return path
+
+
+# Create a function to write a sheet where Arrow cannot hold mixed type columns
+def write_parquet(df, path):
+    '''Write dataframe to parquet, store object columns with mixed types as strings.'''
+    try:
+        df.to_parquet(path, index=False)
+    except (TypeError, ValueError) as e:
+        # Excel columns often mix numbers and text, pyarrow raises ArrowTypeError/ArrowInvalid for those
+        logging.info(f'Writing {path} with text columns: {e}')
+        mixed = {c: 'string' for c in df.columns if df[c].dtype == object}
+        df.astype(mixed).to_parquet(path, index=False)
+    return path
+
+
+# Create a function to write every requested output format
+def write_outputs(sheets, stem, formats=('xlsx',)):
+    '''Write sheets as stem.xlsx and/or one stem_<sheet>.parquet/.csv sidecar per sheet, return written paths.'''
+    paths = []
+    for output_format in formats:
+        if output_format == 'xlsx':
+            paths.append(write_excel(sheets, f'{stem}.xlsx'))
+        elif output_format == 'parquet':
+            paths.extend(write_parquet(df, f'{stem}_{name}.parquet') for name, df in sheets.items())
+        elif output_format == 'csv':
+            for name, df in sheets.items():
+                df.to_csv(f'{stem}_{name}.csv', index=False)
+                paths.append(f'{stem}_{name}.csv')
+        else:
+            raise ValueError(f'Unknown output format {output_format}')
+
+    logging.info(f'Wrote {", ".join(os.path.basename(p) for p in paths)}')
+    return paths
@@ -0,0 +1,103 @@
+# Import dependences
+import logging
+from itertools import islice, chain, repeat
+
+# Import dependences to manipulate data
+import pandas as pd
+
+
+# Create a function to iterate over the cell values of a sheet without loading the workbook
+def iter_sheet_rows(path, sheet_name=0):
+    '''Yield cell values of every row of a sheet as lists, from the first row of the sheet, None for empty cells.'''
+    try:
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        CalamineWorkbook = None
+
+    # calamine parses in Rust and hands over one row at a time
+    if CalamineWorkbook is not None:
+        workbook = CalamineWorkbook.from_path(path)
+        sheet = workbook.get_sheet_by_index(sheet_name) if isinstance(sheet_name, int) else workbook.get_sheet_by_name(sheet_name)
+
+        # calamine starts at the first used cell, pad so row and column positions match the sheet
+        start_row, start_col = sheet.start or (0, 0)
+        padding = [None] * start_col
+        for row in chain(repeat([], start_row), sheet.iter_rows()):
+            yield padding + [None if value == '' else int(value) if isinstance(value, float) and value.is_integer() else value
+                             for value in row]
+        return
+
+    # Otherwise openpyxl in read only mode streams the sheet XML instead of building every cell object
+    # It refuses paths not ending in .xlsx, like downloads still named .xlsx.part, a file handle is read by content
+    from openpyxl import load_workbook
+    with open(path, 'rb') as f:
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+            sheet.reset_dimensions()
+            for row in sheet.iter_rows(min_row=1, values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+
+
+# Create a function to name columns the way pandas does
+def column_names(header):
+    '''Return header with Unnamed: <position> for empty cells and .<n> suffixes for repeated names.'''
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        name = f'Unnamed: {i}' if name is None else name
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+# Create a function to read only the wanted rows and columns of a sheet
+def read_filtered(path, skiprows=0, filter_column=None, keep_values=None, columns=None, batch_size=10000, sheet_name=0):
+    '''Yield dataframes of up to batch_size rows whose filter_column is in keep_values, with only columns.'''
+    rows = iter_sheet_rows(path, sheet_name)
+    try:
+        # Header is the first row after skiprows
+        header = column_names(next(islice(rows, skiprows, None), []))
+        columns = list(columns) if columns else list(header)
+        missing = [name for name in columns + ([filter_column] if filter_column else []) if name not in header]
+        if missing:
+            raise KeyError(f"Columns {', '.join(map(str, missing))} not found in {path}")
+        positions = [header.index(name) for name in columns]
+        filter_position = header.index(filter_column) if filter_column else None
+        keep_values = set(keep_values or [])
+
+        batch = []
+        read = 0
+        yielded = False
+        for row in rows:
+            read += 1
+            row = row + [None] * (len(header) - len(row))
+
+            # Drop rows as they are read, only kept rows are ever turned into a dataframe
+            if filter_position is not None:
+                if row[filter_position] not in keep_values:
+                    continue
+            elif all(value is None for value in row):
+                continue
+
+            batch.append([row[i] for i in positions])
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+                yielded = True
+
+        # Last batch, or an empty dataframe with the columns when no row matched
+        if batch or not yielded:
+            yield pd.DataFrame(batch, columns=columns)
+
+        # Log info
+        logging.info(f'Read {read} rows from {path}')
+
+    finally:
+        rows.close()
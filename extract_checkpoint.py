@@ -0,0 +1,150 @@
+# Import dependences
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+
+# Import dependence to write and memory map Arrow IPC files
+import pyarrow as pa
+
+# Import dependence to compare queries regardless of formatting
+from query_cache import normalize_sql
+
+
+# Parts are uncompressed Arrow IPC files, read back memory mapped without decoding
+PART_FORMAT = 'arrow'
+
+
+# Create a function to identify a query independent of its formatting
+def query_hash(query, dsn=''):
+    '''Return short sha256 of the query, normalized outside quoted literals, and the DSN it runs against.'''
+    return hashlib.sha256(f'{dsn}\n{normalize_sql(query)}'.encode()).hexdigest()[:16]
+
+
+class ExtractCheckpoint:
+    '''Extract of one query saved as Arrow IPC parts while it streams, so a failed load can resume without querying again.'''
+
+    def __init__(self, directory, query, dsn='', run_date=None, max_age_hours=24, finish_on_failure=True):
+        self.directory = directory
+        self.key = query_hash(query, dsn)
+        self.run_date = run_date or datetime.today().strftime('%Y-%m-%d')
+        self.max_age_hours = max_age_hours
+        self.finish_on_failure = finish_on_failure
+        self.path = os.path.join(directory, f'{self.key}_{self.run_date}')
+        self.rows = 0
+        self.parts = 0
+
+    @staticmethod
+    def read_meta(path):
+        '''Return meta of the checkpoint at path, empty dict if it has none.'''
+        try:
+            with open(os.path.join(path, 'meta.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, path=None, **meta):
+        '''Update meta of the checkpoint, write to a temporary file first so it is never half written.'''
+        path = path or self.path
+        meta = {**self.read_meta(path), **meta}
+        with open(os.path.join(path, 'meta.json.tmp'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+    def find(self):
+        '''Return path of the newest complete checkpoint of this query that is not loaded yet and not too old, else None.'''
+        if not os.path.isdir(self.directory):
+            return None
+
+        # A load that failed late in the evening is usually rerun the next morning, so earlier run dates count as well
+        oldest = time.time() - self.max_age_hours * 3600
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            path = os.path.join(self.directory, name)
+            if not name.startswith(f'{self.key}_'):
+                continue
+            meta = self.read_meta(path)
+            if meta.get('format') != PART_FORMAT:
+                continue
+            if meta.get('complete') and not meta.get('loaded') and meta.get('completed_ts', 0) >= oldest:
+                return path
+        return None
+
+    def write(self, chunks):
+        '''Yield chunks unchanged after saving each one as an Arrow IPC part, mark the checkpoint complete at the end.'''
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        self._save_meta(query_hash=self.key, run_date=self.run_date, created_at=datetime.now().isoformat(timespec='seconds'),
+                        format=PART_FORMAT, complete=False, loaded=False)
+
+        chunks = iter(chunks)
+        try:
+            for chunk in chunks:
+                self._write_part(chunk)
+                yield chunk
+
+        except GeneratorExit:
+            # The load stopped early: read the rest of the extract so the next run does not have to query again
+            if self.finish_on_failure:
+                logging.warning(f'Load stopped after {self.rows} rows, finishing extract into checkpoint {self.path}')
+                try:
+                    for chunk in chunks:
+                        self._write_part(chunk)
+                    self._complete()
+                except Exception:
+                    logging.error('Unable to finish extract into checkpoint', exc_info=True)
+            raise
+
+        self._complete()
+
+    def _write_part(self, chunk):
+        '''Save chunk as the next Arrow IPC part, each part keeps its own schema like the chunks did.'''
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        with pa.ipc.new_file(os.path.join(self.path, f'part-{self.parts:05d}.arrow'), table.schema) as writer:
+            writer.write_table(table)
+        self.parts += 1
+        self.rows += len(chunk)
+
+    def _complete(self):
+        '''Mark the checkpoint complete, only complete checkpoints are resumed.'''
+        self._save_meta(complete=True, rows=self.rows, parts=self.parts, completed_ts=time.time())
+        logging.info(f'Saved extract checkpoint {self.path}: {self.rows} rows in {self.parts} parts')
+
+    def read(self, path=None):
+        '''Yield one dataframe per part of the checkpoint at path, numeric columns without nulls point into the mapped file.'''
+        self.path = path or self.path
+        meta = self.read_meta(self.path)
+
+        # Log info
+        logging.info(f"Resuming from extract checkpoint {self.path} of {meta.get('created_at')}: {meta.get('rows')} rows")
+
+        # The map stays open while a dataframe uses its buffers, split blocks keep pandas from copying columns together
+        for i in range(meta.get('parts', 0)):
+            table = pa.ipc.open_file(pa.memory_map(os.path.join(self.path, f'part-{i:05d}.arrow'))).read_all()
+            yield table.to_pandas(split_blocks=True)
+
+    def mark_loaded(self):
+        '''Mark the checkpoint loaded, so a later run of the same query extracts fresh data.'''
+        if os.path.isdir(self.path):
+            self._save_meta(loaded=True, loaded_at=datetime.now().isoformat(timespec='seconds'))
+
+    @staticmethod
+    def cleanup(directory, retention_days=7):
+        '''Remove checkpoints older than retention_days, return number of checkpoints removed.'''
+        if not os.path.isdir(directory):
+            return 0
+
+        removed = 0
+        oldest = time.time() - retention_days * 86400
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < oldest:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+
+        # Log info
+        if removed:
+            logging.info(f'Removed {removed} extract checkpoints older than {retention_days} days from {directory}')
+        return removed
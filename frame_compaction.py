@@ -0,0 +1,73 @@
+# Import dependences
+import logging
+
+# Import dependences to manipulate data
+import numpy as np
+import pandas as pd
+
+
+# Create a function to get the Arrow backed string dtype
+def arrow_string_dtype():
+    '''Return the pyarrow backed string dtype, None when pyarrow is not installed.'''
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pd.StringDtype('pyarrow')
+
+
+# Create a function to find the smallest dtype a column fits in without changing values
+def compact_column(s, max_category_ratio=0.5, downcast=True, string_dtype=None):
+    '''Return column as categorical, Arrow string or narrower number when that keeps every value, else unchanged.'''
+    # Text: repeated values become categories, the rest Arrow strings instead of one Python object per cell
+    if s.dtype == object or isinstance(s.dtype, pd.StringDtype):
+        # Excel columns mixing numbers and text stay objects, the writers handle those
+        if pd.api.types.infer_dtype(s, skipna=True) != 'string':
+            return s
+        count = s.count()
+        if count and s.nunique() <= count * max_category_ratio:
+            return s.astype('category')
+        return s.astype(string_dtype) if string_dtype is not None and s.dtype != string_dtype else s
+
+    if not downcast or pd.api.types.is_bool_dtype(s):
+        return s
+
+    # Numbers: smallest integer type that holds the range, float32 only if no value changes
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast='integer')
+    if s.dtype == np.float64:
+        narrow = s.astype(np.float32)
+        return narrow if np.array_equal(narrow.to_numpy(dtype=np.float64), s.to_numpy(), equal_nan=True) else s
+
+    return s
+
+
+# Create a function to shrink the memory a dataframe holds
+def compact(df, name='dataframe', max_category_ratio=0.5, downcast=True, strings=True, exclude=(), stats=None, level=logging.INFO):
+    '''Return df with compacted column dtypes, log memory before and after, add bytes to stats dict when given.'''
+    before = df.memory_usage(index=True, deep=True).sum()
+    string_dtype = arrow_string_dtype() if strings else None
+
+    # Work by position, Excel sheets may repeat a column name
+    columns = {}
+    for i, col in enumerate(df.columns):
+        if col in exclude:
+            continue
+        compacted = compact_column(df.iloc[:, i], max_category_ratio, downcast, string_dtype)
+        if compacted.dtype != df.iloc[:, i].dtype:
+            columns[i] = compacted
+
+    # Replace changed columns in a shallow copy, the input dataframe is left as is
+    if columns:
+        df = df.copy(deep=False)
+        for i, values in columns.items():
+            df.isetitem(i, values)
+    after = df.memory_usage(index=True, deep=True).sum()
+
+    if stats is not None:
+        stats['before'] = stats.get('before', 0) + before
+        stats['after'] = stats.get('after', 0) + after
+
+    # Log info
+    logging.log(level, f'Compacted {name}: {before / 2 ** 20:.1f} MB to {after / 2 ** 20:.1f} MB, {len(columns)} of {len(df.columns)} columns changed')
+    return df
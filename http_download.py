@@ -0,0 +1,46 @@
+# Import dependences
+import os
+import hashlib
+import logging
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+
+# Create a function to download a file only when the server has a newer version
+def conditional_download(url, path, validators=None, chunk_size=2 ** 20, timeout=60):
+    '''Stream url to path unless it is unchanged since validators, return (changed, validators of the download).'''
+    validators = dict(validators or {})
+
+    # Ask the server to answer 304 Not Modified when our copy is still current
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304:
+            logging.info(f'{url} is not modified since {validators.get("last_modified") or validators.get("etag")}')
+            return False, validators
+        raise
+
+    # Write to a partial file first so a broken download never replaces the last good file
+    digest = hashlib.sha256()
+    with response, open(f'{path}.part', 'wb') as f:
+        for block in iter(lambda: response.read(chunk_size), b''):
+            digest.update(block)
+            f.write(block)
+        downloaded = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                      'sha256': digest.hexdigest()}
+
+    # Servers without validators send the whole file again, same content is still unchanged
+    if downloaded['sha256'] == validators.get('sha256'):
+        os.remove(f'{path}.part')
+        logging.info(f'{url} content is unchanged')
+        return False, downloaded
+
+    os.replace(f'{path}.part', path)
+    logging.info(f'Downloaded {url} to {path}: {os.path.getsize(path)} bytes')
+    return True, downloaded
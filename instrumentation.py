@@ -0,0 +1,213 @@
+# Import dependences
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import socket
+import logging
+import logging.handlers
+import tempfile
+import functools
+import threading
+from datetime import datetime
+
+
+# Metrics file and stage records of the current run
+_lock = threading.Lock()
+_records = []
+_settings = {'metrics_file': 'stage_metrics.jsonl', 'job': os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python',
+             'log_file': None, 'run_log_file': None}
+run_id = uuid.uuid4().hex[:12]
+
+
+# Create a function to set where stage metrics are written
+def configure(log_file=None, job=None, metrics_file=None):
+    '''Write metrics as JSON lines next to log_file, or to metrics_file, tagged with job name.'''
+    if metrics_file is None and log_file is not None:
+        metrics_file = f'{os.path.splitext(log_file)[0]}_metrics.jsonl'
+    if metrics_file is not None:
+        _settings['metrics_file'] = metrics_file
+    if job is not None:
+        _settings['job'] = job
+
+
+# Create a function to log to a rotating file and keep this run's lines apart for notification emails
+def configure_logging(log_file, max_bytes=10 * 2 ** 20, backup_count=5, when=None):
+    '''Log to log_file rotated by size, or by time when when is set (e.g. 'midnight'), and to a file holding only this run.'''
+    formatter = logging.Formatter('%(asctime)s -%(levelname)s- %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+
+    # Rotate so the log stops growing forever, keep backup_count old files
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count)
+    else:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+
+    # This run's lines survive rotation in their own file, removed when the script ends
+    fd, run_log_file = tempfile.mkstemp(prefix=f'{os.path.splitext(os.path.basename(log_file))[0]}_run_', suffix='.log')
+    os.close(fd)
+    run_handler = logging.FileHandler(run_log_file, mode='w')
+    atexit.register(_remove_run_log, run_handler, run_log_file)
+
+    for h in (handler, run_handler):
+        h.setFormatter(formatter)
+    logging.basicConfig(level=logging.INFO, handlers=[handler, run_handler])
+
+    _settings['log_file'] = log_file
+    _settings['run_log_file'] = run_log_file
+    return run_log_file
+
+
+def _remove_run_log(handler, path):
+    '''Close and delete the file holding this run's log lines.'''
+    logging.getLogger().removeHandler(handler)
+    handler.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Create a function to find this run's log lines
+def run_log_file(log_file=None):
+    '''Return the file holding only this run's lines of log_file, log_file itself if logging was not configured for it.'''
+    if _settings['run_log_file'] and log_file in (None, _settings['log_file']):
+        return _settings['run_log_file']
+    return log_file
+
+
+# Create a function to get memory of the process
+def memory_mb():
+    '''Return current and peak resident memory of the process in MB, None where it cannot be measured.'''
+    rss, peak = None, None
+    
+    # Current size and, on Windows, the peak working set
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        rss = info.rss / 2 ** 20
+        peak = getattr(info, 'peak_wset', None) and info.peak_wset / 2 ** 20
+    except ImportError:
+        pass
+
+    # Peak size elsewhere, Linux reports KB and macOS reports bytes
+    if peak is None:
+        try:
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+        except ImportError:
+            pass
+
+    return rss, peak
+
+
+class Stage:
+    '''Wall time, CPU time, memory and rows/bytes processed by one stage of a job.'''
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.bytes = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.status = 'ok'
+
+    def add(self, rows=0, bytes=0):
+        '''Count rows and bytes processed by the stage.'''
+        self.rows += rows
+        self.bytes += bytes
+
+    def __enter__(self):
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall += time.perf_counter() - self._wall_start
+        self.cpu += time.process_time() - self._cpu_start
+        if exc_type is not None:
+            self.status = 'error'
+        emit(self)
+        return False
+
+
+# Create a function to write the metrics of a finished stage
+def emit(stage):
+    '''Write stage metrics as one JSON line to the metrics file and keep them for the run summary.'''
+    rss, peak = memory_mb()
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'run_id': run_id,
+        'job': _settings['job'],
+        'host': socket.gethostname(),
+        'stage': stage.name,
+        'status': stage.status,
+        'wall_s': round(stage.wall, 3),
+        'cpu_s': round(stage.cpu, 3),
+        'rss_mb': rss and round(rss, 1),
+        'peak_rss_mb': peak and round(peak, 1),
+        'rows': stage.rows,
+        'bytes': stage.bytes,
+        'rows_per_s': round(stage.rows / stage.wall, 1) if stage.wall > 0 else None,
+    }
+
+    with _lock:
+        _records.append(record)
+        try:
+            with open(_settings['metrics_file'], 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError:
+            # Metrics must never fail the job
+            logging.warning(f"Unable to write stage metrics to {_settings['metrics_file']}", exc_info=True)
+
+    return record
+
+
+# Create a context manager to measure a stage
+def stage(name):
+    '''Return a Stage context manager measuring the block as stage name, count rows and bytes on it.'''
+    return Stage(name)
+
+
+# Create a decorator to measure a function as a stage
+def staged(name=None, rows=None):
+    '''Measure every call of the function as a stage, rows(result) gives the rows processed.'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Stage(name or func.__name__) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.add(rows=rows(result))
+                return result
+        return wrapper
+    return decorator
+
+
+# Create a function to record a stage that was measured piece by piece
+def record_stage(name, wall, cpu, rows=0, bytes=0, status='ok'):
+    '''Emit metrics of a stage whose time was accumulated by the caller, e.g. fetch time of a streamed extract.'''
+    s = Stage(name)
+    s.wall, s.cpu, s.status = wall, cpu, status
+    s.add(rows=rows, bytes=bytes)
+    return emit(s)
+
+
+# Create a function to summarize the stages of this run for notification emails
+def run_summary():
+    '''Return the stage metrics of this run as a plain text table.'''
+    with _lock:
+        records = list(_records)
+
+    if not records:
+        return ''
+
+    lines = [f'Run {run_id} stage metrics:',
+             f"{'stage':<20} {'wall s':>9} {'cpu s':>9} {'peak MB':>9} {'rows':>11} {'rows/s':>11}"]
+    for r in records:
+        peak = r['peak_rss_mb'] if r['peak_rss_mb'] is not None else r['rss_mb']
+        lines.append(f"{r['stage']:<20} {r['wall_s']:>9.2f} {r['cpu_s']:>9.2f} {peak if peak is not None else '-':>9} "
+                     f"{r['rows']:>11} {r['rows_per_s'] if r['rows_per_s'] is not None else '-':>11}")
+    return '\n'.join(lines)
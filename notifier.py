@@ -0,0 +1,241 @@
+# Import dependences
+import os
+import gzip
+import queue
+import atexit
+import smtplib
+import logging
+import threading
+
+# Import dependences to build email with MIME
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.base import MIMEBase
+from email import encoders
+
+
+# Create a function to read at most the end of a file
+def read_tail(path, max_bytes=None, full_path=None):
+    '''Return content of path, only its last max_bytes bytes after a note pointing to full_path when it is longer.'''
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if not max_bytes or size <= max_bytes:
+            return f.read()
+
+        # Start at the first full line within the last max_bytes
+        f.seek(size - max_bytes)
+        f.readline()
+        tail = f.read()
+
+    note = f'[... first {size - len(tail)} bytes truncated, full log in {full_path or os.path.abspath(path)} ...]\n'
+    return note.encode() + tail
+
+
+# Create a function to build a notification email
+def build_message(sender, subject, body, attachment=None, compress=True, max_bytes=None, full_path=None):
+    '''Return email from sender with plain text body and the file at attachment, if any, gzipped and tail truncated.'''
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = sender
+    msg['Subject'] = subject
+
+    # Send plain text (can send html etc)
+    msg.attach(MIMEText(body, 'plain'))
+
+    # Read the file now, so the email holds the content at the time it was queued
+    if attachment:
+        content = read_tail(attachment, max_bytes, full_path)
+        filename = os.path.basename(full_path or attachment)
+        if compress:
+            part = MIMEBase('application', 'gzip')
+            part.set_payload(gzip.compress(content))
+            filename = f'{filename}.gz'
+        else:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(content)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename= {filename}')
+        msg.attach(part)
+
+    return msg
+
+
+class SMTPSession:
+    '''Authenticated SMTP connection that is opened once and reused for every email.'''
+
+    def __init__(self, host='smtp-mail.outlook.com', port=587, username=None, password=None, starttls=True, timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.server = None
+        self.logins = 0
+
+    def connect(self):
+        '''Open the connection and log in, unless it is still open.'''
+        if self.server is not None:
+            try:
+                # Servers drop idle connections, check before reusing it
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except smtplib.SMTPException:
+                pass
+            self.close()
+
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+
+        self.server = server
+        self.logins += 1
+        return server
+
+    def send(self, sender, recipients, msg):
+        '''Send msg over the open connection, reconnect if the server dropped it.'''
+        try:
+            return self.connect().sendmail(sender, recipients, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            raise
+
+    def close(self):
+        '''Log out and close the connection.'''
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+
+class Notifier:
+    '''Send notification emails from a background thread, in batches over one SMTP session.'''
+
+    def __init__(self, sender, recipients, session, retry_policy=None, batch_size=20, idle_timeout=30, compress=True,
+                 max_attachment_bytes=2 * 2 ** 20):
+        self.sender = sender
+        self.recipients = recipients
+        self.session = session
+        self.retry_policy = retry_policy
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.compress = compress
+        self.max_attachment_bytes = max_attachment_bytes
+        self.sent = 0
+        self.failed = 0
+
+        # Emails wait in the queue until the thread sends them
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Send what is left in the queue when the script ends
+        atexit.register(self.close)
+
+    @classmethod
+    def from_config(cls, parser, section='smtp', retry_policy=None):
+        '''Create notifier from credentials and an optional smtp section, missing options keep their defaults.'''
+        email_address = parser.get('credentials', 'email_address')
+        session = SMTPSession(host=parser.get(section, 'host', fallback='smtp-mail.outlook.com'),
+                              port=parser.getint(section, 'port', fallback=587),
+                              username=parser.get(section, 'username', fallback=email_address),
+                              password=parser.get('credentials', 'email_password'),
+                              starttls=parser.getboolean(section, 'starttls', fallback=True))
+        return cls(email_address, parser.get('credentials', 'email_recipient'), session, retry_policy=retry_policy,
+                   batch_size=parser.getint(section, 'batch_size', fallback=20),
+                   idle_timeout=parser.getfloat(section, 'idle_timeout', fallback=30),
+                   compress=parser.getboolean(section, 'compress_attachments', fallback=True),
+                   max_attachment_bytes=parser.getint(section, 'max_attachment_bytes', fallback=2 * 2 ** 20))
+
+    def send(self, subject, body, attachment=None, full_path=None):
+        '''Queue an email with the file at attachment, if any, and return without waiting for the server.'''
+        self._queue.put(build_message(self.sender, subject, body, attachment, self.compress, self.max_attachment_bytes,
+                                      full_path))
+
+        # Start the sending thread on the first email
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notifier', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        '''Send queued emails, keep the session open while more arrive within idle_timeout.'''
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                self.session.close()
+                continue
+
+            # Stop marker from close
+            if batch[0] is None:
+                self._queue.task_done()
+                self.session.close()
+                return
+
+            # Take whatever else is already queued, up to batch_size emails per round
+            while len(batch) < self.batch_size:
+                try:
+                    msg = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if msg is None:
+                    self._queue.put(None)
+                    self._queue.task_done()
+                    break
+                batch.append(msg)
+
+            self._send_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _send_batch(self, batch):
+        '''Send every email of batch over the session, retry transient failures without resending sent ones.'''
+        pending = list(batch)
+
+        def send_pending():
+            while pending:
+                self.session.send(self.sender, self.recipients, pending[0])
+                pending.pop(0)
+                self.sent += 1
+
+        try:
+            if self.retry_policy is not None:
+                self.retry_policy.run(send_pending, description='Sending email')
+            else:
+                send_pending()
+
+            # Log info
+            logging.info(f'Email notification is sent to {self.recipients}: {len(batch)} emails')
+
+        except Exception:
+            self.failed += len(pending)
+
+            # Log error
+            logging.error(f"Unable to send {len(pending)} of {len(batch)} emails: {', '.join(msg['Subject'] for msg in pending)}", exc_info=True)
+
+    def flush(self, timeout=None):
+        '''Wait until every queued email is sent or failed, return True if the queue is empty.'''
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.unfinished_tasks == 0
+
+        # Queue.join has no timeout, wait on its condition instead
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: self._queue.unfinished_tasks == 0, timeout)
+
+    def close(self, timeout=None):
+        '''Send what is left in the queue, then log out.'''
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self.session.close()
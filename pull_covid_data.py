@@ -1,73 +1,87 @@
+import os
+import shutil
 import pandas as pd
 
-# Import dependences to send email with MIME
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Import dependence to send notification emails
+from notifier import Notifier
 
 # Import dependence to read config
 from configparser import ConfigParser
 
+# Import dependence to retry transient failures
+from retry_policy import RetryPolicy
+
+# Import dependence to download only changed files
+from http_download import conditional_download
+
+# Import dependence to remember the validators of the last downloads
+from run_state import read_state, save_state
+
+# Import dependence to read the output format option
+from excel_output import parse_formats
+
+# Import dependence to shrink dataframes after reading
+from frame_compaction import compact
+
+# Import dependence to measure stages
+from instrumentation import configure, staged, run_summary, configure_logging, run_log_file
+
 
 # Initialize variables
 parser = ConfigParser()
 parser.read('pull_covid_csv.ini')
 log_file = parser.get('files', 'log_file')
 save_to_filepath = parser.get('files', 'save_to_filepath')
+state_file = parser.get('files', 'state_file', fallback='covid_state.json')
+download_dir = parser.get('files', 'download_dir', fallback=os.path.join('.cache', 'covid'))
+output_formats = parse_formats(parser.get('settings', 'output_formats', fallback='csv, parquet'))
+compact_frames = parser.getboolean('settings', 'compact_frames', fallback=True)
 email_to_subject = parser.get('emails', 'email_to_subject')
 email_to_error_subject = parser.get('emails', 'email_to_error_subject')
-email_address = parser.get('credentials', 'email_address')
-email_recipient = parser.get('credentials', 'email_recipient')
-email_password = parser.get('credentials', 'email_password')
+retry_policy = RetryPolicy.from_config(parser)
+notifier = Notifier.from_config(parser, retry_policy=retry_policy)
+historical_url = parser.get('urls', 'historical_url', fallback='https://api.covidtracking.com/v1/states/daily.csv')
+current_url = parser.get('urls', 'current_url', fallback='https://api.covidtracking.com/v1/states/current.csv')
+
+# Columns of the covidtracking.com CSVs and the types they are read with, other columns are inferred
+DATE_COLUMNS = ['date']
+CATEGORY_COLUMNS = ['state', 'fips', 'dataQualityGrade', 'totalTestResultsSource']
+COUNT_COLUMNS = [
+    'positive', 'probableCases', 'negative', 'pending', 'totalTestResults', 'hospitalizedCurrently',
+    'hospitalizedCumulative', 'inIcuCurrently', 'inIcuCumulative', 'onVentilatorCurrently', 'onVentilatorCumulative',
+    'recovered', 'death', 'hospitalized', 'hospitalizedDischarged', 'totalTestsViral', 'positiveTestsViral',
+    'negativeTestsViral', 'positiveCasesViral', 'deathConfirmed', 'deathProbable', 'totalTestEncountersViral',
+    'totalTestsPeopleViral', 'totalTestsAntibody', 'positiveTestsAntibody', 'negativeTestsAntibody',
+    'totalTestsPeopleAntibody', 'positiveTestsPeopleAntibody', 'negativeTestsPeopleAntibody',
+    'totalTestsPeopleAntigen', 'positiveTestsPeopleAntigen', 'totalTestsAntigen', 'positiveTestsAntigen',
+    'positiveIncrease', 'negativeIncrease', 'total', 'totalTestResultsIncrease', 'posNeg', 'deathIncrease',
+    'hospitalizedIncrease'
+]
+
+# Folders of the Parquet history, e.g. daily.parquet/state=NY/month=2021-03/
+PARTITION_COLUMNS = ['state', 'month']
 
-# Configure logging information
-logging.basicConfig(level=logging.INFO, filename=log_file, filemode='a', 
-                    format='%(asctime)s -%(levelname)s- %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+# Configure logging information, rotate the log file and keep this run's lines for emails
+configure_logging(log_file, max_bytes=parser.getint('files', 'log_max_bytes', fallback=10 * 2 ** 20),
+                  backup_count=parser.getint('files', 'log_backup_count', fallback=5),
+                  when=parser.get('files', 'log_rotate_when', fallback=None))
+
+# Write stage metrics next to the log file
+configure(log_file, job='pull_covid_data')
 
 
 # Define send_email function
 def send_email(subject, body, attachment=True, filename=log_file):
-    '''Send email with or without attachment.'''
+    '''Queue email with or without attachment, it is sent in the background.'''
 
     logging.info('Trying to send email')
     
     try:
-        # Construct email object
-        msg = MIMEMultipart()
-        msg['From'] = email_address
-        msg['To'] = email_address
-        msg['Subject'] = subject
-        
-        # Send plain text (can send html etc)
-        msg.attach(MIMEText(body,'plain'))
-        
-        if attachment:
-            # Send email with attachments (text, image etc)
-            attachment = open(filename, 'r+b')
-            part = MIMEBase('application', 'octat-stream')
-            part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', "attachment; filename= " + filename)
-            msg.attach(part)
-            attachment.close()
-        
-        # Convert msg object into string
-        text = msg.as_string()
-        
-        # Connect to email and login
-        server = smtplib.SMTP('smtp-mail.outlook.com:587')
-        server.starttls()
-        server.ehlo()
-        server.login(email_address, email_password)
-        
-        # Send email
-        server.sendmail(email_address, email_recipient, text)
-        server.quit()
-        
-        logging.info(f'Email notification is sent to {email_recipient}')
+        # Attach this run's log lines as they are now, gzipped and capped in size
+        notifier.send(subject, body, attachment=run_log_file(filename) if attachment else None, full_path=filename)
         
     except Exception as e:
         
@@ -75,26 +89,138 @@ def send_email(subject, body, attachment=True, filename=log_file):
         raise
 
 
+# Create a function to list the saved files of a download
+def output_paths(name):
+    '''Return saved path per output format of name, e.g. daily.csv and the daily.parquet folder.'''
+    stem = os.path.splitext(name)[0]
+    return {output_format: os.path.join(save_to_filepath, f'{stem}.{output_format}') for output_format in output_formats}
+
+
+# Create a function to download a file unless the server reports it unchanged
+def download(url, path, name, state):
+    '''Download url to path if it changed since the state of name, return (changed, validators).'''
+    # Without the saved files a 304 would leave nothing to keep, download in full
+    saved = all(os.path.exists(p) for p in output_paths(name).values())
+    validators = state.get(name) if saved else None
+    return retry_policy.run(conditional_download, url, path, validators, description=f'Downloading {name}')
+
+
+# Create a function to read a downloaded CSV with declared types
+def read_covid_csv(path):
+    '''Return CSV at path with dates as datetime, counts as nullable integers and codes as categoricals.'''
+    dtype = {**{c: 'Int64' for c in COUNT_COLUMNS}, **{c: 'category' for c in CATEGORY_COLUMNS}}
+    df = pd.read_csv(path, dtype=dtype)
+
+    # Dates come as yyyymmdd numbers
+    for c in DATE_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c].astype(str), format='%Y%m%d')
+
+    # Undeclared text becomes Arrow strings, numbers keep their declared types, so every append writes the same Parquet schema
+    return compact(df, os.path.basename(path), max_category_ratio=0, downcast=False) if compact_frames else df
+
+
+# Create a function to download and parse one file, run in a thread per URL
+def fetch(url, name, state):
+    '''Return (changed, validators, typed dataframe) of url, dataframe is None when it did not change.'''
+    path = os.path.join(download_dir, name)
+    changed, validators = download(url, path, name, state)
+    return changed, validators, read_covid_csv(path) if changed else None
+
+
+# Create a function to write a dataframe in every output format
+def save_frame(df, paths, append=False, partition_cols=None):
+    '''Write df to CSV and/or Parquet, partitioned by month and partition_cols when given, append to existing files.'''
+    for output_format, path in paths.items():
+        if output_format == 'csv':
+            # Keep dates as yyyymmdd like the API, so CSV consumers see the same values
+            df.to_csv(path, mode='a' if append else 'w', header=not append, index=False, date_format='%Y%m%d')
+        elif output_format == 'parquet' and partition_cols:
+            # Each write adds new files to the partition folders, remove the old ones on a full rewrite
+            if not append:
+                shutil.rmtree(path, ignore_errors=True)
+            df.assign(month=df['date'].dt.strftime('%Y-%m')).to_parquet(path, partition_cols=partition_cols, index=False)
+        elif output_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            raise ValueError(f'Unknown output format {output_format}, expected csv or parquet')
+
+
+# Create a function to read the dates of the saved history
+def saved_dates(paths, columns, date_column='date'):
+    '''Return dates in the saved history, None when it is missing or was saved with other columns.'''
+    if not all(os.path.exists(p) for p in paths.values()):
+        return None
+
+    # The API changed its columns when the saved header differs
+    if 'csv' in paths and list(pd.read_csv(paths['csv'], nrows=0).columns) != list(columns):
+        return None
+    if 'parquet' in paths:
+        import pyarrow.dataset as ds
+        names = ds.dataset(paths['parquet'], partitioning='hive').schema.names
+        if set(names) != set(columns) | set(PARTITION_COLUMNS):
+            return None
+
+        # Only the date column is read from the Parquet files
+        return pd.read_parquet(paths['parquet'], columns=[date_column])[date_column].unique()
+
+    return pd.to_datetime(pd.read_csv(paths['csv'], usecols=[date_column])[date_column].astype(str), format='%Y%m%d').unique()
+
+
+# Create a function to add only the days the history does not have yet
+def append_new_dates(df, paths, date_column='date'):
+    '''Append rows of df whose date is not in the saved history, write all of df when there is none, return rows written.'''
+    known_dates = saved_dates(paths, df.columns, date_column)
+
+    # Rewrite in full when there is no history yet or the API changed its columns
+    if known_dates is None:
+        save_frame(df, paths, partition_cols=PARTITION_COLUMNS)
+        logging.info(f"Wrote {len(df)} rows to {', '.join(paths.values())}")
+        return len(df)
+
+    new_rows = df[~df[date_column].isin(known_dates)]
+    if len(new_rows):
+        save_frame(new_rows, paths, append=True, partition_cols=PARTITION_COLUMNS)
+
+    # Log info
+    logging.info(f"Appended {len(new_rows)} rows of {new_rows[date_column].nunique()} new dates to {', '.join(paths.values())}")
+    return len(new_rows)
+
+
 # Define pull_data function
+@staged('pull_data', rows=lambda row_count: row_count)
 def pull_data():
-    '''Pull data from covidtracking.com'''
+    '''Pull changed data from covidtracking.com, return rows written'''
     
     logging.info('Trying to download the CSVs')
     
     try: 
-        # Initialize variables
-        historical_url = "https://api.covidtracking.com/v1/states/daily.csv"
-        current_url = "https://api.covidtracking.com/v1/states/current.csv"
-        
-        # Read from API
-        covid_historical_df = pd.read_csv(historical_url)
-        covid_current_df = pd.read_csv(current_url)
+        state = read_state(state_file)
+        os.makedirs(download_dir, exist_ok=True)
+        row_count = 0
+
+        # Download and parse both files at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            daily = executor.submit(fetch, historical_url, 'daily.csv', state)
+            current = executor.submit(fetch, current_url, 'current.csv', state)
+            _, state['daily.csv'], daily_df = daily.result()
+            _, state['current.csv'], current_df = current.result()
+
+        # History: append only new dates to the saved history
+        if daily_df is not None:
+            row_count += append_new_dates(daily_df, output_paths('daily.csv'))
+
+        # Current values replace the saved files
+        if current_df is not None:
+            save_frame(current_df, output_paths('current.csv'))
+            row_count += len(current_df)
+
+        # Remember validators only once the files are written
+        save_state({name: state[name] for name in ('daily.csv', 'current.csv')}, state_file)
         
-        # Write to CSV
-        covid_historical_df.to_csv(f'{save_to_filepath}\daily.csv', index=False)
-        covid_current_df.to_csv(f'{save_to_filepath}\current.csv', index=False)
+        logging.info('Covid data is downloaded' if row_count else 'Covid data is unchanged, nothing to write')
         
-        logging.info('Covid CSVs are downloaded')
+        return row_count
         
     except Exception as e:
 
@@ -116,11 +242,16 @@ def main():
         logging.info('Pocess completed')
         
         # Send completion email
-        send_email(email_to_subject, 'COVID CSVs are downloaded')
+        send_email(email_to_subject, f'COVID CSVs are downloaded\n\n{run_summary()}')
         
     except Exception as e:
         logging.error('Error occurred; Ended program')
     
+    finally:
+        
+        # Send queued emails and log out of the mail server
+        notifier.close()
+    
     
 if __name__ == "__main__":
     main()
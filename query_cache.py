@@ -0,0 +1,171 @@
+# Import dependences
+import os
+import re
+import time
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# Import dependences to write and memory map Parquet files
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Per-query TTL in a comment of the query, e.g. -- cache_ttl=600 or /* cache_ttl: 0 */ to never cache it
+TTL_HINT = re.compile(r'cache_ttl\s*[=:]\s*(\d+)', re.IGNORECASE)
+
+# Quoted literals and identifiers are matched first, so -- or spaces inside them are never taken for comments or whitespace
+TOKENS = re.compile(r"""(?P<quoted>'(?:[^']|'')*'|"(?:[^"]|"")*")|(?P<space>(?:\s+|/\*.*?\*/|--[^\n]*)+)""", re.DOTALL)
+
+
+# Create a function to compare queries regardless of formatting
+def normalize_sql(query):
+    '''Return query with comments and whitespace outside quotes collapsed to one space, without trailing semicolon.'''
+    query = TOKENS.sub(lambda match: match.group('quoted') if match.group('quoted') is not None else ' ', query)
+    return query.strip().rstrip(';').strip()
+
+
+# Create a function to read the TTL hint of a query
+def query_ttl(query, default):
+    '''Return seconds of a cache_ttl comment in query, default when it has none.'''
+    for token in TOKENS.finditer(query):
+        match = TTL_HINT.search(token.group('space') or '')
+        if match:
+            return int(match.group(1))
+    return default
+
+
+class QueryCache:
+    '''Query results kept as Parquet parts on disk for a TTL, least recently used entries evicted past max_bytes.'''
+
+    def __init__(self, directory, ttl=3600, max_bytes=2 ** 30):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(directory, 'index.sqlite')
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Entries are listed in a SQLite index so processes sharing the directory see the same entries
+        os.makedirs(directory, exist_ok=True)
+        with sqlite3.connect(self.index_file, timeout=30) as con:
+            con.execute('''CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, created REAL, expires REAL,
+                           last_access REAL, bytes INTEGER, rows INTEGER, parts INTEGER)''')
+
+    def key(self, query, dsn=''):
+        '''Return cache key of the normalized query run against dsn.'''
+        return hashlib.sha256(f'{dsn}\n{normalize_sql(query)}'.encode()).hexdigest()
+
+    def lookup(self, key):
+        '''Return (rows, parts) of a fresh entry and mark it used, None when there is none or it expired.'''
+        now = time.time()
+        with self._lock, sqlite3.connect(self.index_file, timeout=30) as con:
+            row = con.execute('SELECT expires, rows, parts FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[0] < now or not os.path.isdir(os.path.join(self.directory, key)):
+                self._remove(con, key)
+                return None
+            con.execute('UPDATE entries SET last_access = ? WHERE key = ?', (now, key))
+        return row[1], row[2]
+
+    def chunks(self, query, dsn, produce):
+        '''Yield dataframe chunks of query from the cache while fresh, else from produce() while caching them.'''
+        ttl = query_ttl(query, self.ttl)
+        if ttl <= 0:
+            yield from produce()
+            return
+
+        key = self.key(query, dsn)
+        entry = self.lookup(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            logging.info(f'Query cache hit {key[:12]}: {entry[0]} rows, {self.hits} hits and {self.misses} misses so far')
+            yield from self._read(key, entry[1])
+            return
+
+        with self._lock:
+            self.misses += 1
+        logging.info(f'Query cache miss {key[:12]}: {self.hits} hits and {self.misses} misses so far')
+        yield from self._store(key, produce(), ttl)
+
+    def _read(self, key, parts):
+        '''Yield one dataframe per cached part, reading the files memory mapped.'''
+        for i in range(parts):
+            yield pq.read_table(os.path.join(self.directory, key, f'part-{i:05d}.parquet'), memory_map=True).to_pandas()
+
+    def _store(self, key, chunks, ttl):
+        '''Yield chunks unchanged while writing them to a new entry, add the entry once all chunks are written.'''
+        tmp = os.path.join(self.directory, f'{key}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(tmp)
+        rows = parts = size = 0
+        complete = False
+        try:
+            for chunk in chunks:
+                path = os.path.join(tmp, f'part-{parts:05d}.parquet')
+                pq.write_table(pa.Table.from_pandas(chunk, preserve_index=False), path)
+                parts += 1
+                rows += len(chunk)
+                size += os.path.getsize(path)
+                yield chunk
+            complete = True
+
+        finally:
+            # A partly read result is never cached
+            if not complete:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self._add(key, tmp, ttl, rows, parts, size)
+
+    def _add(self, key, tmp, ttl, rows, parts, size):
+        '''Move the written entry in place, list it in the index and evict entries past max_bytes.'''
+        if size > self.max_bytes:
+            logging.info(f'Query result {key[:12]} of {size} bytes is larger than the cache, not cached')
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        now = time.time()
+        with self._lock, sqlite3.connect(self.index_file, timeout=30) as con:
+            try:
+                self._remove(con, key)
+                os.rename(tmp, os.path.join(self.directory, key))
+            except OSError:
+                # Another process cached the same query at the same time, keep theirs
+                logging.warning(f'Unable to add query result {key[:12]} to the cache', exc_info=True)
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            con.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, now, now + ttl, now, size, rows, parts))
+            self._evict(con)
+
+        # Log info
+        logging.info(f'Cached query result {key[:12]} for {ttl}s: {rows} rows, {size} bytes')
+
+    def _evict(self, con):
+        '''Remove expired entries, then least recently used ones until the cache fits in max_bytes.'''
+        for (key,) in con.execute('SELECT key FROM entries WHERE expires < ?', (time.time(),)).fetchall():
+            self._remove(con, key)
+
+        total = con.execute('SELECT COALESCE(SUM(bytes), 0) FROM entries').fetchone()[0]
+        for key, size in con.execute('SELECT key, bytes FROM entries ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove(con, key)
+            total -= size
+            logging.info(f'Evicted query result {key[:12]} of {size} bytes from the cache')
+
+    def _remove(self, con, key):
+        '''Remove an entry from the index and disk.'''
+        con.execute('DELETE FROM entries WHERE key = ?', (key,))
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def log_stats(self):
+        '''Log hits and misses of this run and the size of the cache.'''
+        with sqlite3.connect(self.index_file, timeout=30) as con:
+            entries, size = con.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries').fetchone()
+        logging.info(f'Query cache: {self.hits} hits, {self.misses} misses, {entries} entries of {size} bytes in {self.directory}')
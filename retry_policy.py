@@ -0,0 +1,148 @@
+# Import dependences
+import time
+import random
+import socket
+import logging
+import smtplib
+from urllib.error import HTTPError
+
+# Import dependence to classify database errors
+from sqlalchemy import exc
+
+
+# Errors worth another attempt: lost connections, timeouts and transient database states
+RETRYABLE_ERRORS = (
+    exc.OperationalError,
+    exc.InterfaceError,
+    exc.TimeoutError,
+    exc.DisconnectionError,
+    ConnectionError,
+    socket.timeout,
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    OSError,
+)
+
+# Errors that fail the same way every time: bad SQL, bad data, bad credentials
+FATAL_ERRORS = (
+    exc.ProgrammingError,
+    exc.IntegrityError,
+    exc.DataError,
+    exc.NotSupportedError,
+    exc.ArgumentError,
+    exc.CompileError,
+    exc.NoSuchTableError,
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    FileNotFoundError,
+    PermissionError,
+)
+
+# Teradata error codes of transient failures: deadlock, concurrent change conflict, dispatcher timeout, recovery rollback
+RETRYABLE_TERADATA_CODES = ('2631', '3598', '3111', '2828')
+
+
+class RetryPolicy:
+    '''Retry failed operations with exponential backoff, jitter and a max elapsed time.'''
+
+    def __init__(self, max_attempts=5, base_delay=2.0, max_delay=120.0, max_elapsed=1800.0, jitter=0.5,
+                 retryable=(), fatal=(), sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.jitter = jitter
+        self.retryable = RETRYABLE_ERRORS + tuple(retryable)
+        self.fatal = FATAL_ERRORS + tuple(fatal)
+        self.sleep = sleep
+
+    @classmethod
+    def from_config(cls, parser, section='retry', **kwargs):
+        '''Create policy from a config section, missing options keep their defaults.'''
+        options = {}
+        for name in ('base_delay', 'max_delay', 'max_elapsed', 'jitter'):
+            if parser.has_option(section, name):
+                options[name] = parser.getfloat(section, name)
+        if parser.has_option(section, 'max_attempts'):
+            options['max_attempts'] = parser.getint(section, 'max_attempts')
+        options.update(kwargs)
+        return cls(**options)
+
+    def is_retryable(self, error):
+        '''Return True if error is transient and the operation may succeed on another attempt.'''
+        # HTTP errors other than throttling and server errors will not go away
+        if isinstance(error, HTTPError):
+            return error.code == 429 or error.code >= 500
+
+        if isinstance(error, self.fatal):
+            return False
+
+        if isinstance(error, self.retryable):
+            return True
+
+        # A dropped connection invalidates it, the next attempt gets a new one
+        if isinstance(error, exc.DBAPIError) and error.connection_invalidated:
+            return True
+
+        # Teradata reports most errors as DatabaseError, only some of them are transient
+        if isinstance(error, exc.DatabaseError):
+            return any(code in str(error.orig) for code in RETRYABLE_TERADATA_CODES)
+
+        return False
+
+    def backoff(self, attempt):
+        '''Return seconds to wait after attempt failed: exponential, capped and jittered.'''
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def retrying(self, description='operation'):
+        '''Return a tracker for a retry loop of description.'''
+        return Retrying(self, description)
+
+    def run(self, func, *args, description=None, **kwargs):
+        '''Call func with args until it succeeds or the policy gives up, return its result.'''
+        tracker = self.retrying(description or getattr(func, '__name__', 'operation'))
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not tracker.failed(e):
+                    raise
+
+
+class Retrying:
+    '''Track attempts and time since the last progress of one retry loop.'''
+
+    def __init__(self, policy, description):
+        self.policy = policy
+        self.description = description
+        self.attempt = 0
+        self.start = time.monotonic()
+
+    def failed(self, error):
+        '''Record a failed attempt, wait and return True if it should be retried, else return False.'''
+        self.attempt += 1
+        elapsed = time.monotonic() - self.start
+
+        # Fatal errors are not retried at all
+        if not self.policy.is_retryable(error):
+            logging.error(f'{self.description} failed with fatal error, not retrying: {type(error).__name__}')
+            return False
+
+        # Give up when attempts or time run out
+        delay = self.policy.backoff(self.attempt)
+        if self.attempt >= self.policy.max_attempts or elapsed + delay > self.policy.max_elapsed:
+            logging.error(f'{self.description} failed; giving up after {self.attempt} attempts in {elapsed:.0f}s')
+            return False
+
+        # Log warning and wait before next attempt
+        logging.warning(f'''{self.description} failed; attempt #{self.attempt} of {self.policy.max_attempts}, retrying in {delay:.1f}s
+                            {type(error).__name__}''')
+        self.policy.sleep(delay)
+        return True
+
+    def succeeded(self):
+        '''Reset attempts and elapsed time after progress was made, so max_elapsed bounds the time stuck on one failure.'''
+        self.attempt = 0
+        self.start = time.monotonic()
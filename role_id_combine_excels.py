@@ -1,70 +1,135 @@
 import pandas as pd
 import glob
+import os
 from datetime import datetime
 
-# Initialize variables
-path = "input/*.xlsx"
-li = []
-
-
-# For each file in the path, read into DataFrame and append each to a list
-for fname in glob.glob(path):
-    df = pd.read_excel(fname)
-    li.append(df)
-    
-# Concat DataFrames in the list by row and remove rows that have NA in functional area
-df_all_functions = pd.concat(li, axis=0, ignore_index=True) 
-df_all_functions = df_all_functions[df_all_functions['Functional Area'].notna()]
-
-# Read mapping file and select 3 columns
-df_id_mapping = pd.read_excel("mapping.xlsx", sheet_name="Role-ID")
-df_id_mapping = df_id_mapping[['Role Name', 'ID', 'ID Description']]
-
-# Remove row if it contains certain words in the Role Name column
-rm_ls = ['BATCH', 'CUTOVER', 'FUNCTIONAL', 'CONFIG', 'RESIDUAL']
-rm_str = '|'.join(rm_ls)
-df_id_mapping = df_id_mapping[~df_id_mapping['Role Name'].str.contains(rm_str, case=False)]
-
-# Group all corresponding role names in one row per ID and ID Description
-df_id_mapping = df_id_mapping.groupby(['ID', 'ID Description'])['Role Name'].apply(', '.join).reset_index()
-
-# Merge DataFrames
-df_roles = pd.merge(df_all_functions, df_id_mapping, how="left", left_on = "App ID", right_on = "ID")
-
-# Put all rows with role ID into a DataFrame and the ones with no ID into another DataFrame
-df_roles_exist = df_roles[df_roles['ID'].notna()].copy()
-df_roles_need_research = df_roles[df_roles['ID'].isnull()].copy()
-
-
-# For each function area, get the corresponding role names into a list
-ls_all_unique_roles = []
-for function in df_roles['Functional Area'].unique().tolist():
-    role_list = df_roles.loc[df_roles['Functional Area'] == function, 'Role Name'].tolist()
-    
-    # Extend list roles by appending elements from list x
-    roles = []
-    for r in role_list:
-        if type(r) != float:
-            x = r.split(',')            
-            roles.extend(x)
-            
-    # Remove duplicate roles in a function area        
-    unique_roles = set(roles)
-    ls_unique_roles = list(unique_roles)
-    
-    # Append series of unique roles into a list ls_all_unique_roles 
-    # with the corresponding function as column header
-    ls_all_unique_roles.append(pd.Series(ls_unique_roles, name=function))
-
-    
-# Concate list of series by column into a DataFrame   
-df_all_unique_roles = pd.concat(ls_all_unique_roles, axis=1)
-
-# Get today's date
-today = datetime.today().strftime('%Y_%m_%d')
-
-# Write DataFrames into sheets in an excel file
-with pd.ExcelWriter(f'output_{today}.xlsx') as writer:
-    df_roles_exist.to_excel(writer, sheet_name='Existing_Roles', index=False)
-    df_roles_need_research.to_excel(writer, sheet_name='Need_Research_Roles', index=False)
-    df_all_unique_roles.to_excel(writer, sheet_name='Unique_Roles_Per_Value_Stream', index=False)
\ No newline at end of file
+# Import dependence to read config
+from configparser import ConfigParser
+
+# Import dependence to measure stages
+from instrumentation import configure, stage
+
+# Import dependence to reuse parsed workbooks
+from excel_cache import ExcelParseCache, excel_engine
+
+# Import dependence to reuse the compiled role mapping
+from role_mapping_index import RoleMappingIndex
+
+# Import dependence to write output files
+from excel_output import parse_formats, write_outputs
+
+# Import dependence to shrink dataframes after reading
+from frame_compaction import compact
+
+# Write stage metrics to the working directory
+configure(metrics_file='role_id_combine_excels_metrics.jsonl', job='role_id_combine_excels')
+
+# Initialize variables, config file is optional
+parser = ConfigParser()
+parser.read('role_id_combine_excels.ini')
+path = parser.get('files', 'input_path', fallback="input/*.xlsx")
+cache_dir = parser.get('files', 'cache_dir', fallback=".cache/role_inputs")
+mapping_file = parser.get('files', 'mapping_file', fallback="mapping.xlsx")
+mapping_index = parser.get('files', 'mapping_index', fallback=".cache/role_mapping.sqlite")
+workers = parser.getint('settings', 'workers', fallback=os.cpu_count() or 1)
+output_formats = parse_formats(parser.get('settings', 'output_formats', fallback='xlsx'))
+compact_frames = parser.getboolean('settings', 'compact_frames', fallback=True)
+
+
+def read_inputs(path=path, cache_dir=cache_dir, workers=workers):
+    '''Read every workbook in path into one DataFrame, parse only new or changed workbooks on a process pool.'''
+    cache = ExcelParseCache(cache_dir)
+    fnames = sorted(glob.glob(path))
+
+    # Use calamine when it is installed, it parses several times faster than openpyxl
+    engine = excel_engine()
+    read_kwargs = {'engine': engine} if engine else {}
+
+    # Read each file in the path into a DataFrame, the list keeps the sorted file order
+    with stage('read_inputs') as s:
+        li = cache.read_many(fnames, workers=workers, **read_kwargs)
+        s.add(rows=sum(len(df) for df in li), bytes=sum(os.path.getsize(fname) for fname in fnames))
+
+    # Forget workbooks that were removed from the input folder
+    cache.evict(fnames)
+    cache.save()
+
+    # Concat DataFrames in the list by row and remove rows that have NA in functional area
+    df_all_functions = pd.concat(li, axis=0, ignore_index=True)
+    df_all_functions = df_all_functions[df_all_functions['Functional Area'].notna()]
+
+    # Repeated text such as Functional Area is held as categories
+    return compact(df_all_functions, 'inputs') if compact_frames else df_all_functions
+
+
+def read_mapping(fname=mapping_file, index_file=mapping_index):
+    '''Return role names grouped per ID and ID Description, read from the mapping workbook only when it changed.'''
+    with stage('read_mapping') as s:
+        with RoleMappingIndex(fname, index_file) as index:
+            df_id_mapping = index.frame()
+        s.add(rows=len(df_id_mapping), bytes=os.path.getsize(fname) if index.rebuilt else 0)
+
+    return compact(df_id_mapping, 'mapping') if compact_frames else df_id_mapping
+
+
+def build_unique_roles(df_roles):
+    '''Return one column per Functional Area listing its unique role names.'''
+    with stage('unique_roles') as s:
+        # Columns in order of first appearance, also for areas without any role
+        functions = df_roles['Functional Area'].unique()
+
+        # Many rows share an App ID, so work on integer codes and split each distinct role name string only once
+        area_codes, areas = pd.factorize(df_roles['Functional Area'])
+        role_codes, role_names = pd.factorize(df_roles['Role Name'])
+        keep = (area_codes >= 0) & (role_codes >= 0)
+        split = pd.Series(role_names.astype(str)).str.split(',').explode()
+        piece_codes, pieces = pd.factorize(split)
+
+        # Distinct area and role name pairs, then distinct area and role pairs, in order of first appearance
+        n_names = max(len(role_names), 1)
+        pairs = pd.unique(area_codes[keep].astype('int64') * n_names + role_codes[keep])
+        roles = pd.DataFrame({'Area': pairs // n_names}).join(
+            pd.Series(piece_codes, index=split.index, name='Piece'), on=pairs % n_names)
+        n_pieces = max(len(pieces), 1)
+        pairs = pd.unique(roles['Area'].to_numpy(dtype='int64') * n_pieces + roles['Piece'].to_numpy(dtype='int64'))
+
+        # Number roles within each area and pivot the areas into columns
+        roles = pd.DataFrame({'Functional Area': areas.take(pairs // n_pieces),
+                              'Role Name': pieces.take(pairs % n_pieces)})
+        roles['Row'] = roles.groupby('Functional Area', sort=False).cumcount().to_numpy()
+        df_all_unique_roles = roles.pivot(index='Row', columns='Functional Area', values='Role Name')
+        df_all_unique_roles = df_all_unique_roles.reindex(columns=functions).rename_axis(index=None, columns=None)
+        s.add(rows=len(df_roles))
+
+    return df_all_unique_roles.reset_index(drop=True)
+
+
+def main():
+    '''Run functions'''
+    df_all_functions = read_inputs()
+    df_id_mapping = read_mapping()
+
+    # Merge DataFrames
+    with stage('merge') as s:
+        df_roles = pd.merge(df_all_functions, df_id_mapping, how="left", left_on = "App ID", right_on = "ID")
+        s.add(rows=len(df_roles))
+
+    # Put all rows with role ID into a DataFrame and the ones with no ID into another DataFrame
+    df_roles_exist = df_roles[df_roles['ID'].notna()].copy()
+    df_roles_need_research = df_roles[df_roles['ID'].isnull()].copy()
+
+    df_all_unique_roles = build_unique_roles(df_roles)
+
+    # Get today's date
+    today = datetime.today().strftime('%Y_%m_%d')
+
+    # Write DataFrames into sheets in an excel file and/or one parquet or csv file per sheet
+    sheets = {'Existing_Roles': df_roles_exist, 'Need_Research_Roles': df_roles_need_research,
+              'Unique_Roles_Per_Value_Stream': df_all_unique_roles}
+    with stage('write_output') as s:
+        paths = write_outputs(sheets, f'output_{today}', output_formats)
+        s.add(rows=sum(len(df) for df in sheets.values()), bytes=sum(os.path.getsize(p) for p in paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Import dependences
+import os
+import logging
+import sqlite3
+import tempfile
+
+# Import dependences to manipulate data
+import pandas as pd
+
+# Import dependences to detect mapping changes and read Excel
+from excel_cache import file_hash, excel_engine
+
+
+# Role names that are not assigned to users
+EXCLUDED_ROLES = ['BATCH', 'CUTOVER', 'FUNCTIONAL', 'CONFIG', 'RESIDUAL']
+
+
+# Create a function to read and group the mapping workbook
+def compile_mapping(mapping_file='mapping.xlsx', sheet_name='Role-ID'):
+    '''Return role names grouped per ID and ID Description, without excluded roles.'''
+    engine = excel_engine()
+    df_id_mapping = pd.read_excel(mapping_file, sheet_name=sheet_name, **({'engine': engine} if engine else {}))
+    df_id_mapping = df_id_mapping[['Role Name', 'ID', 'ID Description']]
+
+    # Remove row if it contains certain words in the Role Name column
+    rm_str = '|'.join(EXCLUDED_ROLES)
+    df_id_mapping = df_id_mapping[~df_id_mapping['Role Name'].str.contains(rm_str, case=False)]
+
+    # Group all corresponding role names in one row per ID and ID Description
+    return df_id_mapping.groupby(['ID', 'ID Description'])['Role Name'].apply(', '.join).reset_index()
+
+
+class RoleMappingIndex:
+    '''Grouped role mapping kept in a SQLite file keyed by ID, rebuilt only when the mapping workbook changes.'''
+
+    def __init__(self, mapping_file='mapping.xlsx', index_file='.cache/role_mapping.sqlite', sheet_name='Role-ID'):
+        self.mapping_file = mapping_file
+        self.index_file = index_file
+        self.sheet_name = sheet_name
+        self._con = None
+
+        # Build the index on first use and whenever the workbook changed since
+        self.rebuilt = self.refresh()
+
+    def _source(self):
+        '''Return mtime and size of the mapping workbook as strings, as kept in the meta table.'''
+        stat = os.stat(self.mapping_file)
+        return {'mtime': repr(stat.st_mtime), 'size': str(stat.st_size)}
+
+    def is_current(self):
+        '''Return True when the index was built from the current mapping workbook and sheet.'''
+        if not os.path.exists(self.index_file):
+            return False
+
+        try:
+            with sqlite3.connect(self.index_file) as con:
+                meta = dict(con.execute('SELECT key, value FROM meta').fetchall())
+        except sqlite3.DatabaseError:
+            return False
+
+        if meta.get('sheet_name') != self.sheet_name:
+            return False
+
+        # Unchanged mtime and size: trust the index without reading the workbook
+        source = self._source()
+        if all(meta.get(key) == value for key, value in source.items()):
+            return True
+
+        # Touched but same content, e.g. copied again from the share: remember the new mtime and size
+        if meta.get('hash') != file_hash(self.mapping_file):
+            return False
+        with sqlite3.connect(self.index_file) as con:
+            con.executemany('UPDATE meta SET value = ? WHERE key = ?', [(value, key) for key, value in source.items()])
+        return True
+
+    def refresh(self):
+        '''Rebuild the index if the mapping workbook changed, return True when it was rebuilt.'''
+        if self.is_current():
+            return False
+
+        self.close()
+        df_id_mapping = compile_mapping(self.mapping_file, self.sheet_name)
+        meta = {**self._source(), 'hash': file_hash(self.mapping_file), 'sheet_name': self.sheet_name,
+                'mapping_file': os.path.abspath(self.mapping_file)}
+
+        # Build into a temporary file and swap it in, so readers never see a half written index
+        directory = os.path.dirname(os.path.abspath(self.index_file))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.sqlite', dir=directory)
+        os.close(fd)
+        try:
+            con = sqlite3.connect(tmp)
+            try:
+                df_id_mapping.to_sql('role_mapping', con, index=False)
+                con.execute('CREATE INDEX ix_role_mapping_id ON role_mapping (ID)')
+                con.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+                con.executemany('INSERT INTO meta VALUES (?, ?)', meta.items())
+                con.commit()
+            finally:
+                con.close()
+            os.replace(tmp, self.index_file)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+        logging.info(f'Role mapping index rebuilt from {self.mapping_file}: {len(df_id_mapping)} IDs')
+        return True
+
+    def _connection(self):
+        '''Return the open index connection, open it on first use.'''
+        if self._con is None:
+            self._con = sqlite3.connect(self.index_file, check_same_thread=False)
+        return self._con
+
+    def lookup(self, app_id):
+        '''Return every (ID Description, role names) pair of app_id sorted by description, empty list when the ID is not mapped.'''
+        # numpy scalars from dataframes cannot be bound by sqlite3
+        app_id = app_id.item() if hasattr(app_id, 'item') else app_id
+
+        # One ID can have several descriptions, each with its own role names, like the rows read_mapping merges
+        rows = self._connection().execute(
+            'SELECT "ID Description", "Role Name" FROM role_mapping WHERE ID = ? ORDER BY "ID Description"',
+            (app_id,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def frame(self):
+        '''Return the whole index as dataframe with ID, ID Description and Role Name columns.'''
+        return pd.read_sql('SELECT ID, "ID Description", "Role Name" FROM role_mapping', self._connection())
+
+    def close(self):
+        '''Close the index connection.'''
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
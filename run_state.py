@@ -0,0 +1,30 @@
+# Import dependences
+import os
+import json
+import logging
+from datetime import datetime
+
+
+# Create a function to read what the last run saved
+def read_state(filename):
+    '''Return the state saved in the JSON file, empty dict if nothing was saved yet.'''
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+# Create a function to save state for the next run
+def save_state(state, filename):
+    '''Save state to the JSON file with the time it was saved, keep saved keys not in state, return the saved state.'''
+    state = {**read_state(filename), **state, 'updated_at': datetime.now().isoformat(timespec='seconds')}
+
+    # Write to a temporary file first so a failed write never corrupts the state
+    with open(f'{filename}.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f'{filename}.tmp', filename)
+
+    # Log debug
+    logging.debug(f'Saved state to {filename}')
+    return state
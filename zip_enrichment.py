@@ -0,0 +1,98 @@
+# Import dependences
+import sqlite3
+import logging
+from functools import lru_cache
+
+# Import dependences to manipulate data
+import pandas as pd
+
+
+# Columns too large to carry along every row, the notebook dropped polygon from every lookup as well
+HEAVY_COLUMNS = ('polygon',)
+
+
+# Create a function to find the database uszipcode downloads on first use
+def database_file(**search_kwargs):
+    '''Return path of the uszipcode SQLite database, downloading it like SearchEngine(**search_kwargs) does.'''
+    from uszipcode import SearchEngine
+
+    search = SearchEngine(**search_kwargs)
+    try:
+        # uszipcode 1.x keeps the path, older versions only have it on the engine
+        return getattr(search, 'db_file_path', None) or search.engine.url.database
+    finally:
+        search.close()
+
+
+# Create a function to find the zipcode table of a uszipcode database
+def zipcode_table(con):
+    '''Return name and columns of the table keyed by zipcode, simple_zipcode or comprehensive_zipcode.'''
+    tables = [row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+    for table in tables:
+        columns = [row[1] for row in con.execute(f'PRAGMA table_info("{table}")')]
+        if 'zipcode' in columns:
+            return table, columns
+    raise LookupError(f"No zipcode table found, tables are {', '.join(tables) or 'none'}")
+
+
+# Create a function to turn a column of ZIP codes into 5 digit strings
+def normalize_zipcodes(values):
+    '''Return series of 5 digit ZIP strings: ZIP+4 is cut, leading zeros lost by numeric columns are restored.'''
+    values = pd.Series(values)
+    zips = values.astype(str).str.strip().str.extract(r'^(\d{1,5})(?:\.0+)?(?:-?\d{4})?$', expand=False)
+    return zips.str.zfill(5).where(values.notna())
+
+
+class ZipEnricher:
+    '''uszipcode demographic table loaded once into a dataframe, to add ZIP details to whole dataframes at a time.'''
+
+    def __init__(self, db_file=None, columns=None, exclude=HEAVY_COLUMNS, cache_size=4096, **search_kwargs):
+        self.db_file = db_file or database_file(**search_kwargs)
+
+        with sqlite3.connect(self.db_file) as con:
+            self.table, available = zipcode_table(con)
+
+            # Read only the wanted columns, heavy ones never leave the database unless asked for
+            columns = list(columns) if columns else [c for c in available if c not in set(exclude)]
+            unknown = [c for c in columns if c not in available]
+            if unknown:
+                raise KeyError(f"Columns {', '.join(unknown)} not found in {self.table}")
+            if 'zipcode' not in columns:
+                columns = ['zipcode'] + columns
+            select = ', '.join(f'"{c}"' for c in columns)
+            self.frame = pd.read_sql(f'SELECT {select} FROM "{self.table}"', con).set_index('zipcode')
+
+        # Repeated single lookups are answered from the cache
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+        # Log info
+        logging.info(f'Loaded {len(self.frame)} ZIP codes with {len(self.frame.columns)} columns from {self.db_file}')
+
+    def _lookup(self, zipcode):
+        '''Return details of one ZIP code as dict, None when it is unknown.'''
+        zipcode = normalize_zipcodes([zipcode]).iloc[0]
+        if pd.isna(zipcode) or zipcode not in self.frame.index:
+            return None
+        return {'zipcode': zipcode, **self.frame.loc[zipcode].to_dict()}
+
+    def enrich(self, df, zip_column='zip', columns=None, prefix=''):
+        '''Return df with the details of the ZIP code in zip_column as new columns, empty for unknown ZIP codes.'''
+        details = self.frame if columns is None else self.frame[list(columns)]
+        details = details.add_prefix(prefix)
+        clashes = [c for c in details.columns if c in df.columns]
+        if clashes:
+            raise ValueError(f"Columns {', '.join(clashes)} are already in the dataframe, pass a prefix")
+
+        # One indexed lookup for the whole column instead of a query per row
+        keys = normalize_zipcodes(df[zip_column])
+        matched = details.reindex(keys.to_numpy())
+        matched.index = df.index
+
+        # Log info
+        logging.info(f'Enriched {len(df)} rows, {int(keys.isin(details.index).sum())} matched a ZIP code')
+
+        return pd.concat([df, matched], axis=1)
+
+    def cache_info(self):
+        '''Return hits, misses and size of the single lookup cache.'''
+        return self.lookup.cache_info()